@@ -1,23 +1,110 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
+from starlette.routing import Match
 import requests
 import os
-from typing import List, Dict, Optional
+from typing import List, Dict, Deque, Iterable, Optional, Tuple, Any
 import asyncio
+import bisect
+import contextvars
+import csv
+import fcntl
+import functools
+import hashlib
+import hmac
+import importlib
+import importlib.util
+import inspect
+import io
+import mmap
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+import orjson
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, suppress
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, quote, urlsplit
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# MongoDB setup
+class LazyModule:
+    """Import a heavy module on first attribute access instead of at startup"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+# Only the analytics routes need these
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+# MongoDB setup, connected in the lifespan
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client["f1_database"]
+MONGO_TIMEOUT_MS = int(os.environ.get('MONGO_TIMEOUT_MS', '5000'))
+client: Optional[AsyncIOMotorClient] = None
+db = None
 
-app = FastAPI(title="F1 Race Data API", version="1.0.0")
+# After a MongoDB error the session store is skipped for this long, so
+# requests don't each wait out the server selection timeout
+MONGO_RETRY_SECONDS = int(os.environ.get('MONGO_RETRY_SECONDS', '60'))
+mongo_down_until = 0.0
+
+def session_store():
+    """The MongoDB database, unless it failed recently"""
+    return db if db is not None and time.monotonic() >= mongo_down_until else None
+
+def session_store_failed(e: Exception, action: str):
+    """Skip MongoDB for a while after an error"""
+    global mongo_down_until
+    mongo_down_until = time.monotonic() + MONGO_RETRY_SECONDS
+    logger.warning(f"{action}, skipping MongoDB for {MONGO_RETRY_SECONDS}s: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect to MongoDB, start the optional warm-up and flush page stats on shutdown"""
+    global client, db
+    client = AsyncIOMotorClient(MONGO_URL, serverSelectionTimeoutMS=MONGO_TIMEOUT_MS)
+    db = client["f1_database"]
+    
+    background_tasks = [
+        asyncio.create_task(ensure_session_indexes()),
+        asyncio.create_task(flush_page_stats_periodically())
+    ]
+    if WARMUP_ENABLED:
+        background_tasks.append(asyncio.create_task(warm_up()))
+    else:
+        warmup_state["status"] = "disabled"
+    if ADMIN_TOKEN or PROFILE_SAMPLE_RATE:
+        asyncio.get_running_loop().set_task_factory(profiling_task_factory)
+    
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await flush_page_stats()
+        client.close()
+
+app = FastAPI(title="F1 Race Data API", version="1.0.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # CORS setup
 app.add_middleware(
@@ -32,6 +119,870 @@ app.add_middleware(
 JOLPICA_BASE_URL = "https://api.jolpi.ca/ergast/f1"
 OPENF1_BASE_URL = "https://api.openf1.org/v1"
 
+# Cache settings
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', '3600'))
+UPSTREAM_CACHE_TTL = int(os.environ.get('UPSTREAM_CACHE_TTL', '300'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '2048'))
+CACHE_MAX_MB = int(os.environ.get('CACHE_MAX_MB', '128'))
+
+class TTLCache:
+    """In-process LRU cache holding ready-to-send bytes, bounded by entry count and size"""
+
+    def __init__(self, default_ttl: int, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_MB * 1024 * 1024):
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None):
+        self._discard(key)
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + (ttl or self.default_ttl), value)
+        self.size_bytes += len(value)
+        # Evict least recently used entries until both bounds hold again
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry[1])
+
+class SharedMemorySegment:
+    """Memory-mapped cache file shared by every worker process on a host.
+
+    Layout: a header holding the ring write cursor, a table of fixed-size
+    slots (hashed in buckets of SLOTS_PER_BUCKET) and a ring buffer of
+    records. Readers never lock: each slot is guarded by a sequence counter
+    that writers make odd while updating it, and records carry their key and
+    a CRC so entries overwritten by the ring are detected. Writers take an
+    fcntl lock on the key's bucket, so each key has a single writer at a time.
+    """
+
+    MAGIC = b"F1DSCACH"
+    HEADER = struct.Struct("<8sIIQQ")       # magic, version, slot count, data size, write cursor
+    HEADER_SIZE = 64
+    CURSOR = struct.Struct("<Q")
+    CURSOR_OFFSET = 24
+    SLOT = struct.Struct("<QQQId")          # sequence, key hash, record cursor, record length, expires at
+    SLOT_SIZE = 48
+    RECORD = struct.Struct("<III")          # key length, value length, crc32
+    SLOTS_PER_BUCKET = 4
+    VERSION = 1
+
+    def __init__(self, path: str, size_bytes: int, slot_count: int):
+        self.slot_count = slot_count - slot_count % self.SLOTS_PER_BUCKET
+        self.data_offset = self.HEADER_SIZE + self.slot_count * self.SLOT_SIZE
+        self.data_size = size_bytes - self.data_offset
+        if self.data_size <= 0:
+            raise ValueError("Shared cache size is too small for its slot table")
+        
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, self.HEADER_SIZE, 0)
+        try:
+            if os.fstat(self.fd).st_size < size_bytes:
+                os.ftruncate(self.fd, size_bytes)
+            self.map = mmap.mmap(self.fd, size_bytes)
+            magic, version, slot_count, data_size, _ = self.HEADER.unpack_from(self.map, 0)
+            if (magic, version, slot_count, data_size) != (self.MAGIC, self.VERSION, self.slot_count, self.data_size):
+                # First worker (or a new layout): start from an empty table
+                self.map[:self.data_offset] = bytes(self.data_offset)
+                self.HEADER.pack_into(self.map, 0, self.MAGIC, self.VERSION, self.slot_count, self.data_size, 0)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, self.HEADER_SIZE, 0)
+
+    @staticmethod
+    def key_hash(key: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+    def _bucket(self, key_hash: int) -> int:
+        return (key_hash % (self.slot_count // self.SLOTS_PER_BUCKET)) * self.SLOTS_PER_BUCKET
+
+    def _slot_offset(self, slot: int) -> int:
+        return self.HEADER_SIZE + slot * self.SLOT_SIZE
+
+    def _cursor(self) -> int:
+        return self.CURSOR.unpack_from(self.map, self.CURSOR_OFFSET)[0]
+
+    def _read_slot(self, slot: int) -> Optional[Tuple[int, int, int, float]]:
+        offset = self._slot_offset(slot)
+        sequence, key_hash, cursor, length, expires_at = self.SLOT.unpack_from(self.map, offset)
+        if sequence % 2 or self.SLOT.unpack_from(self.map, offset)[0] != sequence:
+            return None
+        return key_hash, cursor, length, expires_at
+
+    def get(self, key: str) -> Optional[bytes]:
+        key_bytes = key.encode()
+        key_hash = self.key_hash(key_bytes)
+        bucket = self._bucket(key_hash)
+        for slot in range(bucket, bucket + self.SLOTS_PER_BUCKET):
+            entry = self._read_slot(slot)
+            if entry is None or entry[0] != key_hash:
+                continue
+            _, cursor, length, expires_at = entry
+            if expires_at < time.time() or self._cursor() - cursor > self.data_size - length:
+                return None
+            
+            start = self.data_offset + cursor % self.data_size
+            key_length, value_length, checksum = self.RECORD.unpack_from(self.map, start)
+            body_start = start + self.RECORD.size
+            record = self.map[body_start:body_start + key_length + value_length]
+            # The ring may have lapped the record while we were copying it
+            if self._cursor() - cursor > self.data_size - length:
+                return None
+            if zlib.crc32(record) != checksum or record[:key_length] != key_bytes:
+                return None
+            return record[key_length:]
+        return None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        key_bytes = key.encode()
+        length = self.RECORD.size + len(key_bytes) + len(value)
+        if length > self.data_size // 4:
+            return
+        
+        key_hash = self.key_hash(key_bytes)
+        bucket = self._bucket(key_hash)
+        bucket_offset = self._slot_offset(bucket)
+        bucket_size = self.SLOTS_PER_BUCKET * self.SLOT_SIZE
+        
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, bucket_size, bucket_offset)
+        try:
+            # Reserve ring space; records never wrap across the end of the ring
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.HEADER_SIZE, 0)
+            try:
+                cursor = self._cursor()
+                if cursor % self.data_size + length > self.data_size:
+                    cursor += self.data_size - cursor % self.data_size
+                self.CURSOR.pack_into(self.map, self.CURSOR_OFFSET, cursor + length)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.HEADER_SIZE, 0)
+            
+            start = self.data_offset + cursor % self.data_size
+            self.RECORD.pack_into(self.map, start, len(key_bytes), len(value), zlib.crc32(key_bytes + value))
+            body_start = start + self.RECORD.size
+            self.map[body_start:body_start + len(key_bytes) + len(value)] = key_bytes + value
+            
+            # Reuse the key's slot, else an empty one, else evict the soonest to expire
+            slots = [(slot, self.SLOT.unpack_from(self.map, self._slot_offset(slot))) for slot in range(bucket, bucket + self.SLOTS_PER_BUCKET)]
+            target = next((slot for slot, fields in slots if fields[1] == key_hash), None)
+            if target is None:
+                target = min(slots, key=lambda item: (item[1][1] != 0, item[1][4]))[0]
+            
+            offset = self._slot_offset(target)
+            sequence = self.SLOT.unpack_from(self.map, offset)[0]
+            self.CURSOR.pack_into(self.map, offset, sequence + 1)
+            self.SLOT.pack_into(self.map, offset, sequence + 1, key_hash, cursor, length, time.time() + ttl)
+            self.CURSOR.pack_into(self.map, offset, sequence + 2)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, bucket_size, bucket_offset)
+
+class SharedMemoryCache:
+    """TTLCache-compatible view over a namespace of the shared memory segment"""
+
+    def __init__(self, segment: SharedMemorySegment, namespace: str, default_ttl: int):
+        self.segment = segment
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.segment.get(self.namespace + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None):
+        self.segment.set(self.namespace + key, value, ttl or self.default_ttl)
+
+# Worker processes share one cache segment, by default whenever uvicorn
+# runs more than one of them (it reads WEB_CONCURRENCY for --workers)
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '1'))
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH') or ('/dev/shm/f1datasite-cache' if WEB_CONCURRENCY > 1 else None)
+SHARED_CACHE_SIZE_MB = int(os.environ.get('SHARED_CACHE_SIZE_MB', '256'))
+SHARED_CACHE_SLOTS = int(os.environ.get('SHARED_CACHE_SLOTS', '65536'))
+
+# The segment outlives restarts and is shared with workers of other deploys,
+# so every key carries a fingerprint of the code that wrote it
+def code_fingerprint() -> str:
+    with open(__file__, "rb") as source:
+        return hashlib.blake2b(source.read(), digest_size=6).hexdigest()
+
+CACHE_BUILD = os.environ.get('CACHE_BUILD') or code_fingerprint()
+
+# Tag tokens outlive the entries that reference them; a token that was
+# evicted anyway is simply reissued, which only costs a rebuild
+CACHE_TAG_TTL = int(os.environ.get('CACHE_TAG_TTL', str(30 * 24 * 3600)))
+
+# Tag tokens of everything read while building the current cached value
+cache_dependencies: contextvars.ContextVar[Optional[Dict[str, str]]] = contextvars.ContextVar("cache_dependencies", default=None)
+
+class TaggedCache:
+    """Cache whose entries record the token of every tag they were built from.
+
+    Invalidating a tag issues it a new token, which turns every entry built
+    from the old one into a miss. Tokens live in the same kind of store as
+    the entries, so with the shared segment an invalidation reaches every
+    worker. Entries read while another value is being built pass their tags
+    on to it, so derived values are invalidated along with their inputs.
+    """
+
+    TAG_HEADER = struct.Struct("<I")
+
+    def __init__(self, backend, tag_store):
+        self.backend = backend
+        self.tag_store = tag_store
+
+    def token(self, tag: str) -> str:
+        token = self.tag_store.get(tag)
+        if token is None:
+            token = os.urandom(8).hex().encode()
+            self.tag_store.set(tag, token, CACHE_TAG_TTL)
+        return token.decode()
+
+    def tokens(self, tags: Iterable[str]) -> Dict[str, str]:
+        return {tag: self.token(tag) for tag in tags}
+
+    def is_current(self, tokens: Dict[str, str]) -> bool:
+        return all(self.token(tag) == token for tag, token in tokens.items())
+
+    def invalidate(self, tag: str):
+        self.tag_store.set(tag, os.urandom(8).hex().encode(), CACHE_TAG_TTL)
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        
+        header_end = self.TAG_HEADER.size + self.TAG_HEADER.unpack_from(entry)[0]
+        tokens = orjson.loads(entry[self.TAG_HEADER.size:header_end]) if header_end > self.TAG_HEADER.size else {}
+        if not self.is_current(tokens):
+            return None
+        record_dependencies(tokens)
+        return entry[header_end:]
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None, tokens: Optional[Dict[str, str]] = None):
+        header = orjson.dumps(tokens) if tokens else b""
+        self.backend.set(key, self.TAG_HEADER.pack(len(header)) + header + value, ttl)
+
+def record_dependencies(tokens: Dict[str, str]):
+    """Make the value being built depend on these tag tokens"""
+    dependencies = cache_dependencies.get()
+    if dependencies is not None:
+        for tag, token in tokens.items():
+            # Keep the oldest token seen, so a concurrent invalidation wins
+            dependencies.setdefault(tag, token)
+
+@contextmanager
+def collect_dependencies(tags: Iterable[str] = ()):
+    """Collect the tag tokens of a value being built, starting from its own tags.
+
+    Tokens are taken before the build starts, so an invalidation that lands
+    while it runs leaves the result stale rather than cached as fresh.
+    """
+    dependencies = response_cache.tokens(tags)
+    reset_token = cache_dependencies.set(dependencies)
+    try:
+        yield dependencies
+    finally:
+        cache_dependencies.reset(reset_token)
+        record_dependencies(dependencies)
+
+if SHARED_CACHE_PATH:
+    shared_segment = SharedMemorySegment(SHARED_CACHE_PATH, SHARED_CACHE_SIZE_MB * 1024 * 1024, SHARED_CACHE_SLOTS)
+    tag_store = SharedMemoryCache(shared_segment, f"{CACHE_BUILD}:tag:", CACHE_TAG_TTL)
+    response_cache = TaggedCache(SharedMemoryCache(shared_segment, f"{CACHE_BUILD}:response:", RESPONSE_CACHE_TTL), tag_store)
+    upstream_cache = TaggedCache(SharedMemoryCache(shared_segment, f"{CACHE_BUILD}:upstream:", UPSTREAM_CACHE_TTL), tag_store)
+else:
+    tag_store = TTLCache(CACHE_TAG_TTL, max_entries=CACHE_MAX_ENTRIES * 8)
+    response_cache = TaggedCache(TTLCache(RESPONSE_CACHE_TTL), tag_store)
+    upstream_cache = TaggedCache(TTLCache(UPSTREAM_CACHE_TTL), tag_store)
+
+def invalidate_cache_tags(tags: Iterable[str]) -> List[str]:
+    """Invalidate cached responses and upstream bodies built from any of these tags"""
+    tags = sorted(set(tags))
+    for tag in tags:
+        response_cache.invalidate(tag)
+    if tags:
+        logger.info(f"Invalidated cache tags: {', '.join(tags)}")
+    return tags
+
+def dumps(payload: Any) -> bytes:
+    """Serialize a payload to JSON bytes with orjson"""
+    return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+def json_bytes_response(body: bytes) -> Response:
+    """Wrap already-serialized JSON bytes in a raw response"""
+    return Response(content=body, media_type="application/json")
+
+# Time budget of a request, shared by every upstream call it makes; callers
+# may ask for less with an X-Request-Timeout header (seconds). Streaming
+# endpoints only bound each upstream call.
+REQUEST_DEADLINE_SECONDS = float(os.environ.get('REQUEST_DEADLINE_SECONDS', '25'))
+DEADLINE_EXEMPT_PREFIXES = ("/api/export", "/api/batch")
+
+# Longest a single upstream call may take, also outside of requests
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', '10'))
+
+# A duplicate of a slow upstream GET is sent once it has taken longer than
+# this percentile of the host's recent latencies
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', '0.05'))
+HEDGE_MIN_SAMPLES = 20
+UPSTREAM_LATENCY_WINDOW = 500
+
+# At most this share of a host's requests is duplicated, so a slow host
+# isn't sent twice the load
+HEDGE_BUDGET = float(os.environ.get('HEDGE_BUDGET', '0.1'))
+
+# Upstream calls block a thread each, mostly waiting on the network
+UPSTREAM_WORKERS = int(os.environ.get('UPSTREAM_WORKERS', '64'))
+upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix="upstream")
+
+# Monotonic time by which the current request must be answered
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+@app.middleware("http")
+async def enforce_deadline(request, call_next):
+    if request.url.path.startswith(DEADLINE_EXEMPT_PREFIXES):
+        return await call_next(request)
+    
+    budget = REQUEST_DEADLINE_SECONDS
+    with suppress(ValueError):
+        budget = min(budget, float(request.headers.get("x-request-timeout", budget)))
+    token = request_deadline.set(time.monotonic() + budget)
+    try:
+        return await call_next(request)
+    finally:
+        request_deadline.reset(token)
+
+def remaining_budget() -> float:
+    """Seconds left for an upstream call, failing once the request deadline has passed"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return UPSTREAM_TIMEOUT
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+    return min(remaining, UPSTREAM_TIMEOUT)
+
+class HostLatency:
+    """Recent response times of one upstream host, which set its hedging delay"""
+
+    def __init__(self):
+        self.samples: Deque[float] = deque(maxlen=UPSTREAM_LATENCY_WINDOW)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+    def record(self, attempt: asyncio.Future):
+        if not attempt.cancelled() and attempt.exception() is None:
+            self.samples.append(attempt.result()[1])
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[round(percentile / 100 * (len(ordered) - 1))]
+
+    def hedge_delay(self) -> Optional[float]:
+        if len(self.samples) < HEDGE_MIN_SAMPLES or self.hedged >= HEDGE_BUDGET * self.requests:
+            return None
+        return max(HEDGE_MIN_DELAY, self.percentile(HEDGE_PERCENTILE))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "timeouts": self.timeouts,
+            **{f"p{p}": self.percentile(p) for p in (50, 95, 99)},
+        }
+
+upstream_latency: Dict[str, HostLatency] = {}
+
+def timed_get(url: str, timeout: float) -> Tuple[requests.Response, float]:
+    started = time.monotonic()
+    response = requests.get(url, timeout=timeout)
+    return response, time.monotonic() - started
+
+async def hedged_get(url: str) -> Tuple[int, bytes]:
+    """GET an idempotent upstream URL within the remaining budget.
+
+    When the host has enough history and the first attempt outlives its
+    hedging delay, a duplicate is sent and whichever answers first wins.
+    """
+    timeout = remaining_budget()
+    latency = upstream_latency.setdefault(urlsplit(url).netloc, HostLatency())
+    latency.requests += 1
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + timeout
+    hedge_delay = latency.hedge_delay()
+    
+    def attempt() -> asyncio.Future:
+        future = loop.run_in_executor(upstream_executor, timed_get, url, timeout)
+        future.add_done_callback(latency.record)
+        return future
+    
+    attempts = [attempt()]
+    pending = set(attempts)
+    error: Optional[Exception] = None
+    while pending:
+        wait = give_up_at - loop.time()
+        can_hedge = len(attempts) == 1 and hedge_delay is not None and hedge_delay < wait
+        done, pending = await asyncio.wait(pending, timeout=hedge_delay if can_hedge else max(wait, 0), return_when=asyncio.FIRST_COMPLETED)
+        for finished in done:
+            try:
+                response, _ = finished.result()
+            except requests.RequestException as e:
+                error = e
+                continue
+            if finished is not attempts[0]:
+                latency.hedge_wins += 1
+            return response.status_code, response.content
+        if not done:
+            if not can_hedge:
+                break
+            latency.hedged += 1
+            attempts.append(attempt())
+            pending.add(attempts[-1])
+    
+    if error is not None and not isinstance(error, requests.Timeout):
+        raise error
+    latency.timeouts += 1
+    raise HTTPException(status_code=504, detail="Upstream request timed out")
+
+# Sessions of a Jolpica round whose data each round-level table comes from
+JOLPICA_TABLE_SESSIONS = {"results": "race", "laps": "race", "pitstops": "race", "qualifying": "qualifying", "sprint": "sprint"}
+
+def upstream_tags(url: str) -> List[str]:
+    """Cache tags of an upstream body: the season, round or session its URL asks for"""
+    parts = urlsplit(url)
+    if url.startswith(JOLPICA_BASE_URL):
+        segments = parts.path[len(urlsplit(JOLPICA_BASE_URL).path):].strip("/").removesuffix(".json").split("/")
+        if not segments[0].isdigit():
+            return []
+        year = segments[0]
+        if len(segments) < 2 or not segments[1].isdigit():
+            return [f"season:{year}"]
+        round = segments[1]
+        tags = [f"round:{year}:{round}"]
+        if len(segments) > 2 and segments[2] in JOLPICA_TABLE_SESSIONS:
+            tags.append(f"session:{year}:{round}:{JOLPICA_TABLE_SESSIONS[segments[2]]}")
+        return tags
+    
+    query = dict(parse_qsl(parts.query))
+    if "session_key" in query:
+        return [openf1_session_tag(query["session_key"])]
+    if parts.path.endswith("/meetings") and "year" in query:
+        return [f"season:{query['year']}"]
+    return []
+
+# Jolpica only allows short bursts, so at most this many requests go to it
+# at once, from every endpoint together
+JOLPICA_CONCURRENCY = int(os.environ.get('JOLPICA_CONCURRENCY', '4'))
+upstream_host_slots = {urlsplit(JOLPICA_BASE_URL).netloc: asyncio.Semaphore(JOLPICA_CONCURRENCY)}
+
+# Rate-limited (429) upstream GETs are retried after a growing pause
+UPSTREAM_RATE_LIMIT_RETRIES = 3
+UPSTREAM_RATE_LIMIT_DELAY = 0.5
+
+async def paced_get(url: str) -> Tuple[int, bytes]:
+    """GET an upstream URL within its host's concurrency limit, retrying rate-limited attempts"""
+    slots = upstream_host_slots.get(urlsplit(url).netloc)
+    for attempt in range(UPSTREAM_RATE_LIMIT_RETRIES + 1):
+        if slots is None:
+            status, content = await hedged_get(url)
+        else:
+            async with slots:
+                status, content = await hedged_get(url)
+        delay = UPSTREAM_RATE_LIMIT_DELAY * 2 ** attempt
+        if status != 429 or attempt == UPSTREAM_RATE_LIMIT_RETRIES or delay >= remaining_budget():
+            return status, content
+        await asyncio.sleep(delay)
+
+def upstream_error(status: int, not_found: str) -> HTTPException:
+    """The error for a failed upstream GET: not found only when upstream says so"""
+    if status == 404:
+        return HTTPException(status_code=404, detail=not_found)
+    if status == 429:
+        return HTTPException(
+            status_code=503,
+            detail="Upstream rate limit reached, retry shortly",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+        )
+    return HTTPException(status_code=502, detail=f"Upstream error ({status})")
+
+async def fetch_upstream(url: str, cache: bool = True, tags: Iterable[str] = ()) -> Tuple[int, bytes]:
+    """GET an upstream URL, serving successful bodies from the byte cache.
+
+    Cached bodies are tagged with what their URL asks for, plus ``tags``
+    for URLs that don't name it (like a meeting's sessions), and pass
+    those tags on to the value being built from them.
+    """
+    body = upstream_cache.get(url) if cache else None
+    if body is not None:
+        return 200, body
+    
+    tokens = upstream_cache.tokens([*upstream_tags(url), *tags]) if cache else {}
+    status, content = await paced_get(url)
+    if cache and status == 200:
+        upstream_cache.set(url, content, tokens=tokens)
+        record_dependencies(tokens)
+    return status, content
+
+# Admission control: concurrent requests and queued waiters allowed per route class
+ADMISSION_CLASSES = {
+    "light": (64, 256),
+    "standard": (16, 64),
+    "heavy": (4, 16),
+}
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '10'))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', '2'))
+
+# Set while a request holds a slot, so internal calls to other endpoints
+# don't queue behind (and deadlock on) their own class
+admitted_request: contextvars.ContextVar[bool] = contextvars.ContextVar("admitted_request", default=False)
+
+class AdmissionClass:
+    """Concurrency limit with a bounded wait queue for one class of routes"""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    def _reject(self, reason: str) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=f"Server busy ({self.name} requests {reason}), retry shortly",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+        )
+
+    @asynccontextmanager
+    async def admit(self):
+        if admitted_request.get():
+            yield
+            return
+        
+        await self.acquire()
+        token = admitted_request.set(True)
+        try:
+            yield
+        finally:
+            admitted_request.reset(token)
+            self.release()
+
+    async def acquire(self):
+        """Take a slot, waiting in the queue if there is room in it"""
+        # Counted before the first await, so a burst can't all slip past the bound
+        if self.in_flight + self.queued >= self.concurrency + self.queue_size:
+            self.shed += 1
+            raise self._reject("queue full")
+        
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), ADMISSION_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise self._reject("waited too long")
+        finally:
+            self.queued -= 1
+        
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+admission_classes = {
+    name: AdmissionClass(
+        name,
+        int(os.environ.get(f'ADMISSION_{name.upper()}_CONCURRENCY', concurrency)),
+        int(os.environ.get(f'ADMISSION_{name.upper()}_QUEUE', queue_size))
+    )
+    for name, (concurrency, queue_size) in ADMISSION_CLASSES.items()
+}
+
+def admission(route_class: str):
+    """Run an uncached endpoint under its route class's concurrency limit"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with admission_classes[route_class].admit():
+                return await func(*args, **kwargs)
+        wrapper.route_class = route_class
+        return wrapper
+    return decorator
+
+def cached_response(key_template: str, ttl: Optional[int] = None, route_class: str = "standard", tags: Tuple[str, ...] = ()):
+    """Cache an endpoint's serialized payload and serve hits as raw bytes.
+
+    The key and tag templates are formatted with the endpoint's bound
+    arguments. Cache hits are served straight away; misses are admitted
+    under the route class. Entries are invalidated through their tags and
+    the tags of any cached value read while building them.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = key_template.format(**bound.arguments)
+            
+            body = response_cache.get(key)
+            if body is None:
+                async with admission_classes[route_class].admit():
+                    with collect_dependencies(tag.format(**bound.arguments) for tag in tags) as dependencies:
+                        body = dumps(await func(*args, **kwargs))
+                response_cache.set(key, body, ttl, dependencies)
+            return json_bytes_response(body)
+        wrapper.route_class = route_class
+        return wrapper
+    return decorator
+
+# Cache tags of round-level responses: a whole round, or one of its sessions
+ROUND_TAGS = ("round:{year}:{round}",)
+RACE_TAGS = ("session:{year}:{round}:race",)
+QUALIFYING_TAGS = ("session:{year}:{round}:qualifying",)
+
+def openf1_session_tag(session_key: int) -> str:
+    return f"openf1_session:{session_key}"
+
+async def load_cached_payload(endpoint, *args, **kwargs) -> Dict:
+    """Call a cached endpoint internally and decode its payload"""
+    response = await endpoint(*args, **kwargs)
+    return orjson.loads(response.body)
+
+# OpenF1 session names accepted by the analytics endpoints
+OPENF1_SESSION_NAMES = {
+    "race": "Race",
+    "qualifying": "Qualifying",
+    "sprint": "Sprint",
+}
+
+async def get_openf1_session(year: int, round: int, session_name: str) -> Tuple[Dict, Dict]:
+    """Resolve the OpenF1 meeting and named session for a round of a season"""
+    status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/meetings?year={year}")
+    if status != 200:
+        raise upstream_error(status, "Season not found")
+    
+    meetings = orjson.loads(body)
+    races = [m for m in meetings if "Grand Prix" in m.get("meeting_name", "")]
+    
+    if round > len(races) or round < 1:
+        raise HTTPException(status_code=404, detail="Race round not found")
+    
+    race_meeting = races[round - 1]
+    status, body = await fetch_upstream(
+        f"{OPENF1_BASE_URL}/sessions?meeting_key={race_meeting['meeting_key']}&session_name={session_name}",
+        tags=(f"round:{year}:{round}",)
+    )
+    if status != 200:
+        raise upstream_error(status, f"{session_name} session not found")
+    
+    sessions = orjson.loads(body)
+    if not sessions:
+        raise HTTPException(status_code=404, detail=f"{session_name} session not found")
+    
+    return race_meeting, sessions[0]
+
+# OpenF1 resources stored in MongoDB and refreshed incrementally: the
+# natural key rows are merged on, and the field whose watermark bounds the
+# next refresh. Laps are re-requested from slightly before the watermark
+# because a lap row is published when it starts and completed later.
+SYNCED_RESOURCES = {
+    "laps": {"keys": ("driver_number", "lap_number"), "watermark": "date_start", "operator": ">=", "overlap": 300},
+    "position": {"keys": ("driver_number", "date"), "watermark": "date", "operator": ">", "overlap": 0},
+}
+
+# Minimum seconds between upstream refreshes of a live session
+SESSION_SYNC_INTERVAL = int(os.environ.get('SESSION_SYNC_INTERVAL', '15'))
+
+# Once a session ended this long before its last refresh it is final
+SESSION_FINAL_AFTER = int(os.environ.get('SESSION_FINAL_AFTER', '3600'))
+
+session_sync_locks: Dict[Tuple[int, str], asyncio.Lock] = {}
+
+async def ensure_session_indexes():
+    """Create the unique natural-key indexes the incremental merge relies on"""
+    try:
+        await db.sync_watermarks.create_index([("session_key", ASCENDING), ("resource", ASCENDING)], unique=True)
+        for resource, spec in SYNCED_RESOURCES.items():
+            await db[f"openf1_{resource}"].create_index(
+                [("session_key", ASCENDING)] + [(key, ASCENDING) for key in spec["keys"]], unique=True
+            )
+        await db.telemetry_chunks.create_index(
+            [("session_key", ASCENDING), ("driver_number", ASCENDING), ("start", ASCENDING)], unique=True
+        )
+        await db.circuit_maps.create_index("circuit_key", unique=True)
+    except PyMongoError as e:
+        session_store_failed(e, "Could not create session data indexes")
+
+def openf1_sync_rows(status: int, body: bytes) -> Optional[List[Dict]]:
+    """Rows of an incremental OpenF1 reply, or None when it says nothing about the data.
+
+    OpenF1 answers 404 when a filter matches no rows; rate limits and
+    server errors mustn't be mistaken for that.
+    """
+    if status == 200:
+        return orjson.loads(body)
+    if status == 404:
+        return []
+    return None
+
+async def sync_session_rows(session: Dict, resource: str) -> bool:
+    """Fetch rows newer than the stored watermark and merge them into MongoDB.
+
+    Returns True when new or changed rows were stored.
+    """
+    spec = SYNCED_RESOURCES[resource]
+    session_key = session["session_key"]
+    state = await db.sync_watermarks.find_one({"session_key": session_key, "resource": resource})
+    now = datetime.now(timezone.utc)
+    if state and (state.get("final") or (now - state["synced_at"].replace(tzinfo=timezone.utc)).total_seconds() < SESSION_SYNC_INTERVAL):
+        return False
+    
+    url = f"{OPENF1_BASE_URL}/{resource}?session_key={session_key}"
+    watermark = state.get("watermark") if state else None
+    if watermark:
+        since = (datetime.fromisoformat(watermark) - timedelta(seconds=spec["overlap"])).isoformat()
+        url += f"&{spec['watermark']}{spec['operator']}{quote(since)}"
+    
+    # Incremental responses are only useful once, so keep them out of the byte cache
+    status, body = await fetch_upstream(url, cache=False)
+    rows = openf1_sync_rows(status, body)
+    if rows is None:
+        # Leave the watermark alone so the next request retries
+        if state is None:
+            raise HTTPException(status_code=502, detail=f"OpenF1 {resource} unavailable")
+        logger.warning(f"Serving stored {resource} for session {session_key}, OpenF1 answered {status}")
+        return False
+    
+    changed = False
+    if rows:
+        result = await db[f"openf1_{resource}"].bulk_write([
+            UpdateOne(
+                {"session_key": session_key, **{key: row.get(key) for key in spec["keys"]}},
+                {"$set": row},
+                upsert=True
+            )
+            for row in rows
+        ], ordered=False)
+        changed = bool(result.upserted_count or result.modified_count)
+        watermark = max([watermark or ""] + [row.get(spec["watermark"]) or "" for row in rows]) or None
+    
+    session_end = session.get("date_end")
+    final = bool(session_end) and (now - datetime.fromisoformat(session_end)).total_seconds() > SESSION_FINAL_AFTER
+    await db.sync_watermarks.update_one(
+        {"session_key": session_key, "resource": resource},
+        {"$set": {"watermark": watermark, "synced_at": now, "final": final}},
+        upsert=True
+    )
+    if changed:
+        logger.info(f"Synced {len(rows)} {resource} rows for session {session_key}")
+        invalidate_cache_tags([openf1_session_tag(session_key)])
+    return changed
+
+async def fetch_session_rows(session: Dict, resource: str) -> List[Dict]:
+    """Get all rows of an OpenF1 resource (laps, position, drivers, ...) for a session.
+
+    Laps and positions are served from MongoDB after an incremental refresh;
+    other resources (or any resource while MongoDB is unreachable) are
+    fetched whole through the upstream cache.
+    """
+    session_key = session["session_key"]
+    if resource in SYNCED_RESOURCES and session_store() is not None:
+        try:
+            lock = session_sync_locks.setdefault((session_key, resource), asyncio.Lock())
+            async with lock:
+                await sync_session_rows(session, resource)
+            # Tagged after the refresh, so it doesn't invalidate the value being built
+            record_dependencies(response_cache.tokens([openf1_session_tag(session_key)]))
+            sort = [(key, ASCENDING) for key in SYNCED_RESOURCES[resource]["keys"]]
+            return await db[f"openf1_{resource}"].find({"session_key": session_key}, {"_id": 0}).sort(sort).to_list(None)
+        except PyMongoError as e:
+            session_store_failed(e, f"Session store unavailable, fetching {resource} for {session_key} in full")
+    
+    status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/{resource}?session_key={session_key}")
+    if status not in (200, 404):
+        raise upstream_error(status, f"No {resource} for session {session_key}")
+    return orjson.loads(body) if status == 200 else []
+
+# Jolpica caps the page size of its tables
+JOLPICA_PAGE_LIMIT = 100
+
+async def fetch_jolpica_laps(year: int, round: int) -> List[Dict]:
+    """Fetch every lap timing of a Jolpica race as flat {lap, driverId, position, time} rows"""
+    def page_url(offset: int) -> str:
+        return f"{JOLPICA_BASE_URL}/{year}/{round}/laps.json?limit={JOLPICA_PAGE_LIMIT}&offset={offset}"
+    
+    status, body = await fetch_upstream(page_url(0))
+    if status != 200:
+        raise upstream_error(status, "Lap times not found")
+    
+    pages = [orjson.loads(body)]
+    total = int(pages[0]["MRData"].get("total", 0))
+    
+    # The first page tells us how many timings exist, fetch the rest together
+    responses = await asyncio.gather(*[
+        fetch_upstream(page_url(offset))
+        for offset in range(JOLPICA_PAGE_LIMIT, total, JOLPICA_PAGE_LIMIT)
+    ])
+    for status, body in responses:
+        if status != 200:
+            raise upstream_error(status, "Incomplete lap times from Jolpica")
+        pages.append(orjson.loads(body))
+    
+    rows = []
+    for page in pages:
+        for race in page["MRData"]["RaceTable"]["Races"]:
+            for lap in race.get("Laps", []):
+                for timing in lap.get("Timings", []):
+                    rows.append({
+                        "lap": int(lap["number"]),
+                        "driverId": timing["driverId"],
+                        "position": int(timing["position"]),
+                        "time": timing["time"],
+                    })
+    return rows
+
+def parse_lap_times(times: "pd.Series") -> "pd.Series":
+    """Convert Jolpica "m:ss.sss" lap times to seconds"""
+    parts = times.astype(str).str.split(":")
+    minutes = parts.str[-2].where(parts.str.len() > 1, "0")
+    return pd.to_numeric(minutes, errors="coerce") * 60 + pd.to_numeric(parts.str[-1], errors="coerce")
+
 @app.get("/")
 async def root():
     return {"message": "F1 Race Data API", "status": "active"}
@@ -59,17 +1010,19 @@ async def get_seasons():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/seasons/{year}")
+@cached_response("season:{year}", route_class="light", tags=("season:{year}",))
 async def get_season_details(year: int):
     """Get detailed information for a specific season"""
     try:
         if year <= 2022:
             # Use Jolpica API for historical data
-            response = requests.get(f"{JOLPICA_BASE_URL}/{year}.json")
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Season not found")
+            status, body = await fetch_upstream(f"{JOLPICA_BASE_URL}/{year}.json")
+            if status != 200:
+                raise upstream_error(status, "Season not found")
             
-            data = response.json()
+            data = orjson.loads(body)
             races = data["MRData"]["RaceTable"]["Races"]
+            search_index.add_calendar(year, races)
             
             return {
                 "year": year,
@@ -79,13 +1032,14 @@ async def get_season_details(year: int):
             }
         else:
             # Use OpenF1 API for modern data
-            response = requests.get(f"{OPENF1_BASE_URL}/meetings?year={year}")
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Season not found")
+            status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/meetings?year={year}")
+            if status != 200:
+                raise upstream_error(status, "Season not found")
             
-            meetings = response.json()
+            meetings = orjson.loads(body)
             # Filter out pre-season testing
             races = [m for m in meetings if "Grand Prix" in m.get("meeting_name", "")]
+            search_index.add_calendar(year, races)
             
             return {
                 "year": year,
@@ -93,6 +1047,8 @@ async def get_season_details(year: int):
                 "races": races,
                 "data_source": "openf1"
             }
+    except HTTPException:
+        raise
     except requests.RequestException as e:
         logger.error(f"API request error: {e}")
         raise HTTPException(status_code=500, detail="External API error")
@@ -101,17 +1057,19 @@ async def get_season_details(year: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/seasons/{year}/drivers")
+@cached_response("drivers:{year}", route_class="light", tags=("season:{year}",))
 async def get_season_drivers(year: int):
     """Get all drivers for a specific season"""
     try:
         if year <= 2022:
             # Use Jolpica API
-            response = requests.get(f"{JOLPICA_BASE_URL}/{year}/drivers.json")
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Drivers not found")
+            status, body = await fetch_upstream(f"{JOLPICA_BASE_URL}/{year}/drivers.json")
+            if status != 200:
+                raise upstream_error(status, "Drivers not found")
             
-            data = response.json()
+            data = orjson.loads(body)
             drivers = data["MRData"]["DriverTable"]["Drivers"]
+            search_index.add_drivers(year, drivers)
             
             return {
                 "year": year,
@@ -121,11 +1079,11 @@ async def get_season_drivers(year: int):
             }
         else:
             # Use OpenF1 API - get drivers from first race session
-            meetings_response = requests.get(f"{OPENF1_BASE_URL}/meetings?year={year}")
-            if meetings_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Season not found")
+            status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/meetings?year={year}")
+            if status != 200:
+                raise upstream_error(status, "Season not found")
             
-            meetings = meetings_response.json()
+            meetings = orjson.loads(body)
             if not meetings:
                 return {"year": year, "drivers": [], "total": 0, "data_source": "openf1"}
             
@@ -135,20 +1093,25 @@ async def get_season_drivers(year: int):
                 return {"year": year, "drivers": [], "total": 0, "data_source": "openf1"}
             
             # Get sessions for first race
-            sessions_response = requests.get(f"{OPENF1_BASE_URL}/sessions?meeting_key={first_race['meeting_key']}&session_name=Race")
-            if sessions_response.status_code != 200:
+            status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/sessions?meeting_key={first_race['meeting_key']}&session_name=Race", tags=(f"round:{year}:1",))
+            if status not in (200, 404):
+                raise upstream_error(status, "Drivers not found")
+            if status != 200:
                 return {"year": year, "drivers": [], "total": 0, "data_source": "openf1"}
             
-            sessions = sessions_response.json()
+            sessions = orjson.loads(body)
             if not sessions:
                 return {"year": year, "drivers": [], "total": 0, "data_source": "openf1"}
             
             # Get drivers from first race session
-            drivers_response = requests.get(f"{OPENF1_BASE_URL}/drivers?session_key={sessions[0]['session_key']}")
-            if drivers_response.status_code != 200:
+            status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/drivers?session_key={sessions[0]['session_key']}")
+            if status not in (200, 404):
+                raise upstream_error(status, "Drivers not found")
+            if status != 200:
                 return {"year": year, "drivers": [], "total": 0, "data_source": "openf1"}
             
-            drivers = drivers_response.json()
+            drivers = orjson.loads(body)
+            search_index.add_drivers(year, drivers)
             
             return {
                 "year": year,
@@ -156,6 +1119,8 @@ async def get_season_drivers(year: int):
                 "total": len(drivers),
                 "data_source": "openf1"
             }
+    except HTTPException:
+        raise
     except requests.RequestException as e:
         logger.error(f"API request error: {e}")
         raise HTTPException(status_code=500, detail="External API error")
@@ -164,17 +1129,19 @@ async def get_season_drivers(year: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/seasons/{year}/constructors")
+@cached_response("constructors:{year}", route_class="light", tags=("season:{year}",))
 async def get_season_constructors(year: int):
     """Get all constructors/teams for a specific season"""
     try:
         if year <= 2022:
             # Use Jolpica API
-            response = requests.get(f"{JOLPICA_BASE_URL}/{year}/constructors.json")
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Constructors not found")
+            status, body = await fetch_upstream(f"{JOLPICA_BASE_URL}/{year}/constructors.json")
+            if status != 200:
+                raise upstream_error(status, "Constructors not found")
             
-            data = response.json()
+            data = orjson.loads(body)
             constructors = data["MRData"]["ConstructorTable"]["Constructors"]
+            search_index.add_constructors(year, constructors)
             
             return {
                 "year": year,
@@ -184,7 +1151,7 @@ async def get_season_constructors(year: int):
             }
         else:
             # Use OpenF1 API - extract teams from drivers
-            drivers_data = await get_season_drivers(year)
+            drivers_data = await load_cached_payload(get_season_drivers, year)
             teams = {}
             
             for driver in drivers_data["drivers"]:
@@ -198,12 +1165,16 @@ async def get_season_constructors(year: int):
                         "team_colour": team_colour
                     }
             
+            search_index.add_constructors(year, list(teams.values()))
+            
             return {
                 "year": year,
                 "constructors": list(teams.values()),
                 "total": len(teams),
                 "data_source": "openf1"
             }
+    except HTTPException:
+        raise
     except requests.RequestException as e:
         logger.error(f"API request error: {e}")
         raise HTTPException(status_code=500, detail="External API error")
@@ -212,16 +1183,17 @@ async def get_season_constructors(year: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/seasons/{year}/standings/drivers")
+@cached_response("standings:{year}", route_class="light", tags=("season:{year}",))
 async def get_driver_standings(year: int):
     """Get driver championship standings for a season"""
     try:
         if year <= 2022:
             # Use Jolpica API
-            response = requests.get(f"{JOLPICA_BASE_URL}/{year}/driverStandings.json")
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Standings not found")
+            status, body = await fetch_upstream(f"{JOLPICA_BASE_URL}/{year}/driverStandings.json")
+            if status != 200:
+                raise upstream_error(status, "Standings not found")
             
-            data = response.json()
+            data = orjson.loads(body)
             standings = data["MRData"]["StandingsTable"]["StandingsLists"]
             
             return {
@@ -238,6 +1210,8 @@ async def get_driver_standings(year: int):
                 "message": "Standings calculation for modern seasons not yet implemented",
                 "data_source": "openf1"
             }
+    except HTTPException:
+        raise
     except requests.RequestException as e:
         logger.error(f"API request error: {e}")
         raise HTTPException(status_code=500, detail="External API error")
@@ -245,38 +1219,97 @@ async def get_driver_standings(year: int):
         logger.error(f"Error getting driver standings for {year}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Sessions and per-session OpenF1 resources the race details endpoint can return
+RACE_DETAIL_SECTIONS = ["race", "qualifying"]
+RACE_DETAIL_INCLUDES = ["drivers", "positions", "laps"]
+RACE_DETAIL_SESSION_NAMES = {"race": "Race", "qualifying": "Qualifying"}
+
+def parse_selection(value: Optional[str], choices: List[str], parameter: str) -> str:
+    """Validate a comma-separated selection and return it in canonical order"""
+    if value is None:
+        return ",".join(choices)
+    selected = {item.strip() for item in value.split(",") if item.strip()}
+    if not selected or selected - set(choices):
+        raise HTTPException(status_code=400, detail=f"{parameter} must list values from {', '.join(choices)}")
+    return ",".join(choice for choice in choices if choice in selected)
+
+def paginate_session_laps(data: Dict, laps: List[Dict], laps_after: Optional[int], limit: Optional[int]):
+    """Keep one window of laps, and the position updates made during it, in a session's data"""
+    first = (laps_after or 0) + 1
+    last = first + limit - 1 if limit else None
+    
+    lap_starts: Dict[int, datetime] = {}
+    for lap in laps:
+        if lap.get("date_start") and lap.get("lap_number") is not None:
+            started = datetime.fromisoformat(lap["date_start"])
+            lap_starts[lap["lap_number"]] = min(started, lap_starts.get(lap["lap_number"], started))
+    
+    # The window runs from the first car starting its first lap to the first car starting the lap after its last
+    window_start = min((started for number, started in lap_starts.items() if number >= first), default=None) if laps_after else None
+    window_end = min((started for number, started in lap_starts.items() if last is not None and number > last), default=None)
+    
+    if "laps" in data:
+        data["laps"] = [lap for lap in laps if (lap.get("lap_number") or 0) >= first and (last is None or lap["lap_number"] <= last)]
+    if "positions" in data:
+        data["positions"] = [
+            update for update in data["positions"]
+            if (window_start is None or datetime.fromisoformat(update["date"]) >= window_start)
+            and (window_end is None or datetime.fromisoformat(update["date"]) < window_end)
+        ]
+    data["page"] = {
+        "laps_after": laps_after,
+        "limit": limit,
+        "next_laps_after": last if last is not None and any(number > last for number in lap_starts) else None
+    }
+
 @app.get("/api/races/{year}/{round}")
-async def get_race_details(year: int, round: int):
-    """Get detailed information for a specific race including qualifying and race results"""
+async def get_race_details(year: int, round: int, sections: Optional[str] = None, include: Optional[str] = None,
+                           laps_after: Optional[int] = None, limit: Optional[int] = None):
+    """Get detailed information for a specific race including qualifying and race results.
+
+    ``sections`` picks the sessions (race, qualifying) and, for OpenF1
+    seasons, ``include`` picks their resources (drivers, positions, laps);
+    only those are fetched. ``laps_after`` and ``limit`` page through the
+    laps, with the position updates made during them.
+    """
+    if (laps_after is not None and laps_after < 0) or (limit is not None and limit < 1):
+        raise HTTPException(status_code=400, detail="laps_after must be at least 0 and limit at least 1")
+    return await load_race_details(
+        year, round,
+        parse_selection(sections, RACE_DETAIL_SECTIONS, "sections"),
+        parse_selection(include, RACE_DETAIL_INCLUDES, "include"),
+        laps_after, limit
+    )
+
+@cached_response("race_details:{year}:{round}:{sections}:{include}:{laps_after}:{limit}", route_class="heavy", tags=ROUND_TAGS + RACE_TAGS + QUALIFYING_TAGS)
+async def load_race_details(year: int, round: int, sections: str, include: str, laps_after: Optional[int], limit: Optional[int]):
     try:
+        sections = sections.split(",")
         if year <= 2022:
-            # Use Jolpica API - get both qualifying and race results
-            race_response = requests.get(f"{JOLPICA_BASE_URL}/{year}/{round}/results.json")
-            qualifying_response = requests.get(f"{JOLPICA_BASE_URL}/{year}/{round}/qualifying.json")
-            
-            if race_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Race not found")
-            
-            race_data = race_response.json()["MRData"]["RaceTable"]["Races"]
+            # Use Jolpica API - get the requested qualifying and race results
+            urls = {
+                "race": f"{JOLPICA_BASE_URL}/{year}/{round}/results.json",
+                "qualifying": f"{JOLPICA_BASE_URL}/{year}/{round}/qualifying.json"
+            }
+            responses = dict(zip(sections, await asyncio.gather(*[fetch_upstream(urls[section]) for section in sections])))
             
-            qualifying_data = []
-            if qualifying_response.status_code == 200:
-                qualifying_data = qualifying_response.json()["MRData"]["RaceTable"]["Races"]
+            if "race" in responses and responses["race"][0] != 200:
+                raise upstream_error(responses["race"][0], "Race not found")
             
-            return {
-                "year": year,
-                "round": round,
-                "race_data": race_data,
-                "qualifying_data": qualifying_data,
-                "data_source": "jolpica"
-            }
+            response = {"year": year, "round": round}
+            for section, (status, body) in responses.items():
+                if status not in (200, 404):
+                    raise upstream_error(status, "Race not found")
+                response[f"{section}_data"] = orjson.loads(body)["MRData"]["RaceTable"]["Races"] if status == 200 else []
+            response["data_source"] = "jolpica"
+            return response
         else:
             # For OpenF1, get race and qualifying data
-            meetings_response = requests.get(f"{OPENF1_BASE_URL}/meetings?year={year}")
-            if meetings_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Season not found")
+            status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/meetings?year={year}")
+            if status != 200:
+                raise upstream_error(status, "Season not found")
             
-            meetings = meetings_response.json()
+            meetings = orjson.loads(body)
             races = [m for m in meetings if "Grand Prix" in m.get("meeting_name", "")]
             
             if round > len(races) or round < 1:
@@ -286,52 +1319,39 @@ async def get_race_details(year: int, round: int):
             meeting_key = race_meeting['meeting_key']
             
             # Get all sessions for this meeting
-            sessions_response = requests.get(f"{OPENF1_BASE_URL}/sessions?meeting_key={meeting_key}")
-            if sessions_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Sessions not found")
-            
-            sessions = sessions_response.json()
-            
-            # Find race and qualifying sessions
-            race_session = next((s for s in sessions if s['session_name'] == 'Race'), None)
-            qualifying_session = next((s for s in sessions if s['session_name'] == 'Qualifying'), None)
-            
-            race_data = {"meeting": race_meeting}
-            qualifying_data = {"meeting": race_meeting}
-            
-            if race_session:
-                # Get race results
-                drivers_response = requests.get(f"{OPENF1_BASE_URL}/drivers?session_key={race_session['session_key']}")
-                position_response = requests.get(f"{OPENF1_BASE_URL}/position?session_key={race_session['session_key']}")
-                laps_response = requests.get(f"{OPENF1_BASE_URL}/laps?session_key={race_session['session_key']}")
-                
-                race_data.update({
-                    "session": race_session,
-                    "drivers": drivers_response.json() if drivers_response.status_code == 200 else [],
-                    "positions": position_response.json() if position_response.status_code == 200 else [],
-                    "laps": laps_response.json() if laps_response.status_code == 200 else []
-                })
-            
-            if qualifying_session:
-                # Get qualifying results
-                drivers_response = requests.get(f"{OPENF1_BASE_URL}/drivers?session_key={qualifying_session['session_key']}")
-                position_response = requests.get(f"{OPENF1_BASE_URL}/position?session_key={qualifying_session['session_key']}")
-                laps_response = requests.get(f"{OPENF1_BASE_URL}/laps?session_key={qualifying_session['session_key']}")
-                
-                qualifying_data.update({
-                    "session": qualifying_session,
-                    "drivers": drivers_response.json() if drivers_response.status_code == 200 else [],
-                    "positions": position_response.json() if position_response.status_code == 200 else [],
-                    "laps": laps_response.json() if laps_response.status_code == 200 else []
-                })
+            status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/sessions?meeting_key={meeting_key}", tags=(f"round:{year}:{round}",))
+            if status != 200:
+                raise upstream_error(status, "Sessions not found")
             
-            return {
-                "year": year,
-                "round": round,
-                "race_data": race_data,
-                "qualifying_data": qualifying_data,
-                "data_source": "openf1"
-            }
+            sessions = orjson.loads(body)
+            
+            # Laps bound the position window of a page, so they are needed even when not returned
+            resources = include.split(",")
+            paginated = laps_after is not None or limit is not None
+            fetched = resources + ["laps"] if paginated and "laps" not in resources else resources
+            
+            async def load_section(section: str) -> Dict:
+                session = next((s for s in sessions if s['session_name'] == RACE_DETAIL_SESSION_NAMES[section]), None)
+                data = {"meeting": race_meeting}
+                if session:
+                    rows = await asyncio.gather(*[
+                        fetch_session_rows(session, "position" if resource == "positions" else resource)
+                        for resource in fetched
+                    ])
+                    rows = dict(zip(fetched, rows))
+                    data["session"] = session
+                    data.update((resource, rows[resource]) for resource in resources)
+                    if paginated:
+                        paginate_session_laps(data, rows["laps"], laps_after, limit)
+                return data
+            
+            response = {"year": year, "round": round}
+            for section, data in zip(sections, await asyncio.gather(*[load_section(section) for section in sections])):
+                response[f"{section}_data"] = data
+            response["data_source"] = "openf1"
+            return response
+    except HTTPException:
+        raise
     except requests.RequestException as e:
         logger.error(f"API request error: {e}")
         raise HTTPException(status_code=500, detail="External API error")
@@ -339,17 +1359,114 @@ async def get_race_details(year: int, round: int):
         logger.error(f"Error getting race details for {year}/{round}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+QUALIFYING_SEGMENTS = ["Q1", "Q2", "Q3"]
+
+# Fallback when race control has no phase markers: a qualifying break is
+# the longest pause between consecutive lap starts, and at least this long
+QUALIFYING_BREAK_SECONDS = 240
+
+DELETED_LAP_PATTERN = re.compile(r"CAR (\d+)\b.*\bDELETED\b.*\bLAP (\d+)\b")
+
+def format_lap_time(seconds: float) -> Optional[str]:
+    """Format seconds as a Jolpica-style "m:ss.sss" lap time"""
+    if seconds != seconds:
+        return None
+    minutes, remainder = divmod(round(float(seconds), 3), 60)
+    return f"{int(minutes)}:{remainder:06.3f}"
+
+def qualifying_phase_starts(race_control: List[Dict], lap_starts: "pd.Series") -> "pd.Series":
+    """Find when Q2 and Q3 started, from race control phases or the breaks between laps"""
+    phases = pd.DataFrame.from_records(race_control, columns=["date", "qualifying_phase"]).dropna()
+    if not phases.empty:
+        phases["date"] = pd.to_datetime(phases["date"], utc=True, errors="coerce", format="ISO8601")
+        starts = phases.groupby(pd.to_numeric(phases["qualifying_phase"], errors="coerce"))["date"].min()
+        starts = starts.reindex([2, 3]).dropna()
+        if not starts.empty:
+            return starts.sort_values()
+    
+    ordered = lap_starts.dropna().sort_values(ignore_index=True)
+    gaps = ordered.diff().dt.total_seconds()
+    breaks = gaps[gaps >= QUALIFYING_BREAK_SECONDS].nlargest(len(QUALIFYING_SEGMENTS) - 1)
+    return ordered[breaks.index].sort_values()
+
+def classify_qualifying(laps: List[Dict], drivers: List[Dict], race_control: List[Dict]) -> Tuple[List[Dict], Dict[str, List[str]]]:
+    """Split OpenF1 qualifying laps into segments and build a Jolpica-style QualifyingResults table"""
+    df = pd.DataFrame.from_records(laps, columns=["driver_number", "lap_number", "date_start", "lap_duration", "is_pit_out_lap"])
+    df = df.dropna(subset=["driver_number", "lap_number", "date_start"])
+    if df.empty:
+        return [], {}
+    
+    df = df.astype({"driver_number": "int64", "lap_number": "int64"})
+    df["date_start"] = pd.to_datetime(df["date_start"], utc=True, errors="coerce", format="ISO8601")
+    df["lap_duration"] = pd.to_numeric(df["lap_duration"], errors="coerce")
+    
+    # Assign every lap to the segment it started in
+    phase_starts = qualifying_phase_starts(race_control, df["date_start"])
+    df["segment"] = np.searchsorted(phase_starts.to_numpy(), df["date_start"].to_numpy(), side="right")
+    
+    deleted = set()
+    for message in race_control:
+        match = DELETED_LAP_PATTERN.search(message.get("message") or "")
+        if match:
+            deleted.add((int(match.group(1)), int(match.group(2))))
+    is_deleted = pd.Series([key in deleted for key in zip(df["driver_number"], df["lap_number"])], index=df.index)
+    
+    valid = df["lap_duration"].notna() & ~df["is_pit_out_lap"].fillna(False).astype(bool) & ~is_deleted
+    best = df[valid].pivot_table(index="driver_number", columns="segment", values="lap_duration", aggfunc="min")
+    best = best.reindex(index=sorted(df["driver_number"].unique()), columns=range(len(QUALIFYING_SEGMENTS)))
+    
+    # Drivers are classified by the deepest segment reached, then by their best time in it
+    deepest = df.groupby("driver_number")["segment"].max().reindex(best.index)
+    deepest_time = best.to_numpy()[np.arange(len(best)), deepest.to_numpy()]
+    order = np.lexsort((np.nan_to_num(deepest_time, nan=np.inf), -deepest.to_numpy()))
+    
+    driver_info = {d.get("driver_number"): d for d in drivers}
+    results = []
+    elimination_order: Dict[str, List[str]] = {segment: [] for segment in QUALIFYING_SEGMENTS[:-1]}
+    for position, index in enumerate(order, start=1):
+        driver_number = int(best.index[index])
+        info = driver_info.get(driver_number, {})
+        team_name = info.get("team_name") or ""
+        result = {
+            "number": str(driver_number),
+            "position": str(position),
+            "Driver": {
+                "driverId": (info.get("full_name") or str(driver_number)).lower().replace(" ", "_"),
+                "permanentNumber": str(driver_number),
+                "code": info.get("name_acronym"),
+                "givenName": info.get("first_name"),
+                "familyName": info.get("last_name")
+            },
+            "Constructor": {
+                "constructorId": team_name.lower().replace(" ", "_"),
+                "name": team_name
+            }
+        }
+        for segment in range(int(deepest.iloc[index]) + 1):
+            result[QUALIFYING_SEGMENTS[segment]] = format_lap_time(best.iat[index, segment])
+        results.append(result)
+        
+        if deepest.iloc[index] < len(QUALIFYING_SEGMENTS) - 1:
+            elimination_order[QUALIFYING_SEGMENTS[int(deepest.iloc[index])]].append(str(driver_number))
+    
+    # Slowest eliminated first
+    for segment in elimination_order:
+        elimination_order[segment].reverse()
+    
+    return results, elimination_order
+
 @app.get("/api/races/{year}/{round}/qualifying")
+@cached_response("qualifying:{year}:{round}", tags=ROUND_TAGS + QUALIFYING_TAGS)
 async def get_qualifying_results(year: int, round: int):
     """Get qualifying results for a specific race"""
     try:
         if year <= 2022:
             # Use Jolpica API
-            response = requests.get(f"{JOLPICA_BASE_URL}/{year}/{round}/qualifying.json")
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Qualifying results not found")
+            status, body = await fetch_upstream(f"{JOLPICA_BASE_URL}/{year}/{round}/qualifying.json")
+            if status != 200:
+                raise upstream_error(status, "Qualifying results not found")
             
-            data = response.json()
+            data = orjson.loads(body)
             qualifying_data = data["MRData"]["RaceTable"]["Races"]
             
             return {
@@ -359,49 +1476,43 @@ async def get_qualifying_results(year: int, round: int):
                 "data_source": "jolpica"
             }
         else:
-            # Use OpenF1 API
-            meetings_response = requests.get(f"{OPENF1_BASE_URL}/meetings?year={year}")
-            if meetings_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Season not found")
-            
-            meetings = meetings_response.json()
-            races = [m for m in meetings if "Grand Prix" in m.get("meeting_name", "")]
-            
-            if round > len(races) or round < 1:
-                raise HTTPException(status_code=404, detail="Race round not found")
-            
-            race_meeting = races[round - 1]
-            
-            # Get qualifying session
-            sessions_response = requests.get(f"{OPENF1_BASE_URL}/sessions?meeting_key={race_meeting['meeting_key']}&session_name=Qualifying")
-            if sessions_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Qualifying session not found")
+            # Use OpenF1 API and classify the session laps into Q1/Q2/Q3
+            race_meeting, qualifying_session = await get_openf1_session(year, round, "Qualifying")
+            session_key = qualifying_session['session_key']
             
-            sessions = sessions_response.json()
-            if not sessions:
-                raise HTTPException(status_code=404, detail="Qualifying session not found")
-            
-            qualifying_session = sessions[0]
+            laps, drivers, race_control = await asyncio.gather(
+                fetch_session_rows(qualifying_session, "laps"),
+                fetch_session_rows(qualifying_session, "drivers"),
+                fetch_session_rows(qualifying_session, "race_control")
+            )
             
-            # Get qualifying data
-            drivers_response = requests.get(f"{OPENF1_BASE_URL}/drivers?session_key={qualifying_session['session_key']}")
-            position_response = requests.get(f"{OPENF1_BASE_URL}/position?session_key={qualifying_session['session_key']}")
-            laps_response = requests.get(f"{OPENF1_BASE_URL}/laps?session_key={qualifying_session['session_key']}")
-            
-            qualifying_data = {
-                "meeting": race_meeting,
-                "session": qualifying_session,
-                "drivers": drivers_response.json() if drivers_response.status_code == 200 else [],
-                "positions": position_response.json() if position_response.status_code == 200 else [],
-                "laps": laps_response.json() if laps_response.status_code == 200 else []
-            }
+            results, elimination_order = classify_qualifying(laps, drivers, race_control)
+            qualifying_data = [{
+                "season": str(year),
+                "round": str(round),
+                "raceName": race_meeting.get("meeting_name"),
+                "Circuit": {
+                    "circuitId": race_meeting.get("circuit_short_name", "").lower().replace(" ", "_"),
+                    "circuitName": race_meeting.get("circuit_short_name"),
+                    "Location": {
+                        "locality": race_meeting.get("location"),
+                        "country": race_meeting.get("country_name")
+                    }
+                },
+                "date": (qualifying_session.get("date_start") or "")[:10],
+                "QualifyingResults": results
+            }]
             
             return {
                 "year": year,
                 "round": round,
+                "session_key": session_key,
+                "elimination_order": elimination_order,
                 "qualifying_data": qualifying_data,
                 "data_source": "openf1"
             }
+    except HTTPException:
+        raise
     except requests.RequestException as e:
         logger.error(f"API request error: {e}")
         raise HTTPException(status_code=500, detail="External API error")
@@ -410,16 +1521,17 @@ async def get_qualifying_results(year: int, round: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/races/{year}/{round}/race")
+@cached_response("race:{year}:{round}", tags=ROUND_TAGS + RACE_TAGS)
 async def get_race_results(year: int, round: int):
     """Get race results for a specific race"""
     try:
         if year <= 2022:
             # Use Jolpica API
-            response = requests.get(f"{JOLPICA_BASE_URL}/{year}/{round}/results.json")
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Race results not found")
+            status, body = await fetch_upstream(f"{JOLPICA_BASE_URL}/{year}/{round}/results.json")
+            if status != 200:
+                raise upstream_error(status, "Race results not found")
             
-            data = response.json()
+            data = orjson.loads(body)
             race_data = data["MRData"]["RaceTable"]["Races"]
             
             return {
@@ -430,11 +1542,11 @@ async def get_race_results(year: int, round: int):
             }
         else:
             # Use OpenF1 API
-            meetings_response = requests.get(f"{OPENF1_BASE_URL}/meetings?year={year}")
-            if meetings_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Season not found")
+            status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/meetings?year={year}")
+            if status != 200:
+                raise upstream_error(status, "Season not found")
             
-            meetings = meetings_response.json()
+            meetings = orjson.loads(body)
             races = [m for m in meetings if "Grand Prix" in m.get("meeting_name", "")]
             
             if round > len(races) or round < 1:
@@ -443,27 +1555,29 @@ async def get_race_results(year: int, round: int):
             race_meeting = races[round - 1]
             
             # Get race session
-            sessions_response = requests.get(f"{OPENF1_BASE_URL}/sessions?meeting_key={race_meeting['meeting_key']}&session_name=Race")
-            if sessions_response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Race session not found")
+            status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/sessions?meeting_key={race_meeting['meeting_key']}&session_name=Race", tags=(f"round:{year}:{round}",))
+            if status != 200:
+                raise upstream_error(status, "Race session not found")
             
-            sessions = sessions_response.json()
+            sessions = orjson.loads(body)
             if not sessions:
                 raise HTTPException(status_code=404, detail="Race session not found")
             
             race_session = sessions[0]
             
             # Get race data
-            drivers_response = requests.get(f"{OPENF1_BASE_URL}/drivers?session_key={race_session['session_key']}")
-            position_response = requests.get(f"{OPENF1_BASE_URL}/position?session_key={race_session['session_key']}")
-            laps_response = requests.get(f"{OPENF1_BASE_URL}/laps?session_key={race_session['session_key']}")
+            drivers, positions, laps = await asyncio.gather(
+                fetch_session_rows(race_session, "drivers"),
+                fetch_session_rows(race_session, "position"),
+                fetch_session_rows(race_session, "laps")
+            )
             
             race_data = {
                 "meeting": race_meeting,
                 "session": race_session,
-                "drivers": drivers_response.json() if drivers_response.status_code == 200 else [],
-                "positions": position_response.json() if position_response.status_code == 200 else [],
-                "laps": laps_response.json() if laps_response.status_code == 200 else []
+                "drivers": drivers,
+                "positions": positions,
+                "laps": laps
             }
             
             return {
@@ -472,6 +1586,8 @@ async def get_race_results(year: int, round: int):
                 "race_data": race_data,
                 "data_source": "openf1"
             }
+    except HTTPException:
+        raise
     except requests.RequestException as e:
         logger.error(f"API request error: {e}")
         raise HTTPException(status_code=500, detail="External API error")
@@ -479,6 +1595,1975 @@ async def get_race_results(year: int, round: int):
         logger.error(f"Error getting race results for {year}/{round}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Seconds of lap time attributed to each remaining lap of fuel load
+FUEL_EFFECT_PER_LAP = float(os.environ.get('FUEL_EFFECT_PER_LAP', '0.06'))
+
+# Laps slower than this ratio of a driver's median are treated as
+# safety car, traffic or outlier laps and ignored for pace figures
+PACE_OUTLIER_RATIO = 1.07
+
+LAP_COLUMNS = [
+    "driver_number", "lap_number", "lap_duration",
+    "duration_sector_1", "duration_sector_2", "duration_sector_3",
+    "is_pit_out_lap",
+]
+
+def round_floats(values, digits: int = 3) -> List[Optional[float]]:
+    """Round an array of floats for output, mapping NaN to None"""
+    return [None if v != v else round(float(v), digits) for v in values]
+
+def compute_lap_pace(laps: List[Dict]) -> Dict:
+    """Compute per-driver pace, sector bests, stints and fuel-corrected trends from OpenF1 laps"""
+    df = pd.DataFrame.from_records(laps, columns=LAP_COLUMNS)
+    if df.empty:
+        return {"total_laps": 0, "drivers": []}
+    
+    df = df.dropna(subset=["driver_number", "lap_number"])
+    df = df.astype({"driver_number": "int64", "lap_number": "int64"})
+    for column in LAP_COLUMNS[2:6]:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    df["is_pit_out_lap"] = df["is_pit_out_lap"].fillna(False).astype(bool)
+    df = df.sort_values(["driver_number", "lap_number"], ignore_index=True)
+    
+    by_driver = df.groupby("driver_number", sort=False)
+    total_laps = int(df["lap_number"].max())
+    
+    # A new stint starts on each driver's first lap and on every pit-out lap
+    first_lap = df["lap_number"] == by_driver["lap_number"].transform("min")
+    df["stint"] = (first_lap | df["is_pit_out_lap"]).astype("int64").groupby(df["driver_number"]).cumsum()
+    
+    # The lap before a pit-out lap is the in-lap
+    in_lap = by_driver["is_pit_out_lap"].shift(-1, fill_value=False).astype(bool)
+    timed = df["lap_duration"].notna() & ~df["is_pit_out_lap"] & ~in_lap & (df["lap_number"] > 1)
+    
+    driver_median = df["lap_duration"].where(timed).groupby(df["driver_number"]).transform("median")
+    clean = timed & (df["lap_duration"] <= driver_median * PACE_OUTLIER_RATIO)
+    
+    # Remove the fuel load still on board so stint trends reflect tyre degradation
+    df["fuel_corrected"] = df["lap_duration"] - FUEL_EFFECT_PER_LAP * (total_laps - df["lap_number"])
+    
+    clean_laps = df[clean]
+    summary = clean_laps.groupby("driver_number").agg(
+        clean_laps=("lap_duration", "size"),
+        median_pace=("lap_duration", "median"),
+        consistency=("lap_duration", "std"),
+        fuel_corrected_median=("fuel_corrected", "median"),
+    )
+    summary = summary.join(by_driver.agg(
+        laps=("lap_number", "size"),
+        best_lap=("lap_duration", "min"),
+    ), how="right").join(df[~df["is_pit_out_lap"] & ~in_lap].groupby("driver_number").agg(
+        best_sector_1=("duration_sector_1", "min"),
+        best_sector_2=("duration_sector_2", "min"),
+        best_sector_3=("duration_sector_3", "min"),
+    ))
+    summary["ideal_lap"] = summary[["best_sector_1", "best_sector_2", "best_sector_3"]].sum(axis=1, min_count=3)
+    
+    # Least-squares slope of fuel-corrected lap time against lap number per stint
+    stint_laps = clean_laps.assign(
+        xy=clean_laps["lap_number"] * clean_laps["fuel_corrected"],
+        xx=clean_laps["lap_number"] ** 2,
+    )
+    stints = df.groupby(["driver_number", "stint"]).agg(
+        start_lap=("lap_number", "min"),
+        end_lap=("lap_number", "max"),
+        laps=("lap_number", "size"),
+    ).join(stint_laps.groupby(["driver_number", "stint"]).agg(
+        median_pace=("lap_duration", "median"),
+        fuel_corrected_median=("fuel_corrected", "median"),
+        mean_x=("lap_number", "mean"),
+        mean_y=("fuel_corrected", "mean"),
+        mean_xy=("xy", "mean"),
+        mean_xx=("xx", "mean"),
+    ))
+    variance = stints["mean_xx"] - stints["mean_x"] ** 2
+    stints["degradation_per_lap"] = ((stints["mean_xy"] - stints["mean_x"] * stints["mean_y"]) / variance).where(variance > 0)
+    
+    stints_by_driver: Dict[int, List[Dict]] = {}
+    for (driver_number, stint), row in zip(stints.index, stints.itertuples(index=False)):
+        stints_by_driver.setdefault(int(driver_number), []).append({
+            "stint": int(stint),
+            "start_lap": int(row.start_lap),
+            "end_lap": int(row.end_lap),
+            "laps": int(row.laps),
+            "median_pace": round_floats([row.median_pace])[0],
+            "fuel_corrected_median": round_floats([row.fuel_corrected_median])[0],
+            "degradation_per_lap": round_floats([row.degradation_per_lap], 4)[0],
+        })
+    
+    summary = summary.sort_values(["median_pace", "best_lap"], na_position="last")
+    drivers = []
+    for driver_number, row in zip(summary.index, summary.itertuples(index=False)):
+        best_lap, median_pace, consistency, fuel_corrected_median, ideal_lap = round_floats(
+            [row.best_lap, row.median_pace, row.consistency, row.fuel_corrected_median, row.ideal_lap]
+        )
+        drivers.append({
+            "driver_number": int(driver_number),
+            "laps": int(row.laps),
+            "clean_laps": 0 if row.clean_laps != row.clean_laps else int(row.clean_laps),
+            "best_lap": best_lap,
+            "median_pace": median_pace,
+            "consistency": consistency,
+            "fuel_corrected_median": fuel_corrected_median,
+            "best_sectors": round_floats([row.best_sector_1, row.best_sector_2, row.best_sector_3]),
+            "ideal_lap": ideal_lap,
+            "stints": stints_by_driver.get(int(driver_number), []),
+        })
+    
+    return {"total_laps": total_laps, "drivers": drivers}
+
+@app.get("/api/races/{year}/{round}/pace")
+async def get_lap_pace(year: int, round: int, session: str = "race"):
+    """Get per-driver lap pace analytics for a session of a race weekend"""
+    if year <= 2022:
+        raise HTTPException(status_code=404, detail="Lap pace analytics are only available from 2023")
+    if session.lower() not in OPENF1_SESSION_NAMES:
+        raise HTTPException(status_code=400, detail=f"Unknown session '{session}'")
+    # One cache entry and tag per session, however the caller spelled it
+    return await load_lap_pace(year, round, session.lower())
+
+@cached_response("pace:{year}:{round}:{session}", tags=ROUND_TAGS + ("session:{year}:{round}:{session}",))
+async def load_lap_pace(year: int, round: int, session: str):
+    try:
+        session_name = OPENF1_SESSION_NAMES[session]
+        race_meeting, race_session = await get_openf1_session(year, round, session_name)
+        laps, drivers = await asyncio.gather(
+            fetch_session_rows(race_session, "laps"),
+            fetch_session_rows(race_session, "drivers")
+        )
+        
+        pace = compute_lap_pace(laps)
+        driver_info = {d.get("driver_number"): d for d in drivers}
+        for entry in pace["drivers"]:
+            info = driver_info.get(entry["driver_number"], {})
+            entry["name_acronym"] = info.get("name_acronym")
+            entry["team_name"] = info.get("team_name")
+        
+        return {
+            "year": year,
+            "round": round,
+            "meeting": race_meeting,
+            "session": race_session,
+            "fuel_effect_per_lap": FUEL_EFFECT_PER_LAP,
+            **pace,
+            "data_source": "openf1"
+        }
+    except HTTPException:
+        raise
+    except requests.RequestException as e:
+        logger.error(f"API request error: {e}")
+        raise HTTPException(status_code=500, detail="External API error")
+    except Exception as e:
+        logger.error(f"Error computing lap pace for {year}/{round}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def compute_race_trace(drivers: List, finish_times: "np.ndarray") -> Dict:
+    """Compute positions, gap to leader and gap to car ahead from a drivers x laps matrix.
+
+    ``finish_times`` holds each driver's cumulative race time at the end of
+    every lap, NaN where the lap was not completed.
+    """
+    if finish_times.size == 0:
+        return {"total_laps": 0, "drivers": []}
+    
+    # The leader of each lap is whoever completed it first
+    leader = np.nanmin(np.where(np.isnan(finish_times), np.inf, finish_times), axis=0)
+    gap_to_leader = finish_times - leader
+    
+    # Sort every lap column (NaN last) to find the car ahead and the running order
+    order = np.argsort(finish_times, axis=0, kind="stable")
+    sorted_times = np.take_along_axis(finish_times, order, axis=0)
+    sorted_gaps = np.full_like(sorted_times, np.nan)
+    sorted_gaps[1:] = np.diff(sorted_times, axis=0)
+    sorted_gaps[0] = np.where(np.isnan(sorted_times[0]), np.nan, 0.0)
+    
+    gap_to_ahead = np.empty_like(finish_times)
+    np.put_along_axis(gap_to_ahead, order, sorted_gaps, axis=0)
+    positions = np.empty(finish_times.shape, dtype=np.int64)
+    np.put_along_axis(positions, order, np.broadcast_to(np.arange(1, finish_times.shape[0] + 1)[:, None], finish_times.shape), axis=0)
+    
+    completed = (~np.isnan(finish_times)).sum(axis=1)
+    traces = []
+    for index, driver in enumerate(drivers):
+        laps = int(completed[index])
+        traces.append({
+            "driver": driver,
+            "laps": laps,
+            "cumulative": round_floats(finish_times[index, :laps]),
+            "gap_to_leader": round_floats(gap_to_leader[index, :laps]),
+            "gap_to_ahead": round_floats(gap_to_ahead[index, :laps]),
+            "position": positions[index, :laps].tolist(),
+        })
+    
+    traces.sort(key=lambda trace: (-trace["laps"], trace["cumulative"][-1] if trace["laps"] else 0))
+    return {"total_laps": int(finish_times.shape[1]), "drivers": traces}
+
+def openf1_finish_times(laps: List[Dict]) -> Tuple[List[int], "np.ndarray"]:
+    """Build the drivers x laps cumulative time matrix from OpenF1 lap start times and durations"""
+    df = pd.DataFrame.from_records(laps, columns=["driver_number", "lap_number", "date_start", "lap_duration"])
+    df = df.dropna(subset=["driver_number", "lap_number"])
+    if df.empty:
+        return [], np.empty((0, 0))
+    
+    df = df.astype({"driver_number": "int64", "lap_number": "int64"})
+    df["date_start"] = pd.to_datetime(df["date_start"], utc=True, errors="coerce", format="ISO8601")
+    df = df.sort_values(["driver_number", "lap_number"], ignore_index=True)
+    
+    # A lap ends when the next one starts; fall back to start plus duration for the final lap
+    start = df["date_start"].min()
+    started = (df["date_start"] - start).dt.total_seconds()
+    next_start = started.groupby(df["driver_number"]).shift(-1)
+    df["finish"] = next_start.fillna(started + pd.to_numeric(df["lap_duration"], errors="coerce"))
+    
+    matrix = df.pivot(index="driver_number", columns="lap_number", values="finish").sort_index(axis=1)
+    matrix = matrix.reindex(columns=range(1, int(matrix.columns.max()) + 1))
+    return matrix.index.tolist(), matrix.to_numpy(dtype=float)
+
+def jolpica_finish_times(rows: List[Dict]) -> Tuple[List[str], "np.ndarray"]:
+    """Build the drivers x laps cumulative time matrix from Jolpica lap timings"""
+    df = pd.DataFrame.from_records(rows, columns=["lap", "driverId", "position", "time"])
+    if df.empty:
+        return [], np.empty((0, 0))
+    
+    df["seconds"] = parse_lap_times(df["time"])
+    matrix = df.pivot(index="driverId", columns="lap", values="seconds").sort_index(axis=1)
+    matrix = matrix.reindex(columns=range(1, int(matrix.columns.max()) + 1))
+    # NaN propagates through cumsum, so laps after a missing one stay incomplete
+    return matrix.index.tolist(), matrix.to_numpy(dtype=float).cumsum(axis=1)
+
+@app.get("/api/races/{year}/{round}/trace")
+@cached_response("trace:{year}:{round}", tags=ROUND_TAGS + RACE_TAGS)
+async def get_race_trace(year: int, round: int):
+    """Get the race trace (cumulative time and gaps per lap) for a specific race"""
+    try:
+        if year <= 2022:
+            drivers, finish_times = jolpica_finish_times(await fetch_jolpica_laps(year, round))
+            trace = compute_race_trace(drivers, finish_times)
+            
+            return {
+                "year": year,
+                "round": round,
+                **trace,
+                "data_source": "jolpica"
+            }
+        else:
+            race_meeting, race_session = await get_openf1_session(year, round, "Race")
+            laps, session_drivers = await asyncio.gather(
+                fetch_session_rows(race_session, "laps"),
+                fetch_session_rows(race_session, "drivers")
+            )
+            
+            drivers, finish_times = openf1_finish_times(laps)
+            trace = compute_race_trace(drivers, finish_times)
+            acronyms = {d.get("driver_number"): d.get("name_acronym") for d in session_drivers}
+            for entry in trace["drivers"]:
+                entry["name_acronym"] = acronyms.get(entry["driver"])
+            
+            return {
+                "year": year,
+                "round": round,
+                "meeting": race_meeting,
+                **trace,
+                "data_source": "openf1"
+            }
+    except HTTPException:
+        raise
+    except requests.RequestException as e:
+        logger.error(f"API request error: {e}")
+        raise HTTPException(status_code=500, detail="External API error")
+    except Exception as e:
+        logger.error(f"Error computing race trace for {year}/{round}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Points for finishing positions under the current regulations (no fastest lap bonus)
+POINTS_BY_POSITION = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
+
+# Normalized results of completed rounds keyed by (year, round), with the
+# cache tag tokens they were built from; only missing or invalidated rounds
+# are re-fetched
+round_results_memo: Dict[Tuple[int, int], Tuple[Dict[str, str], List[Dict]]] = {}
+
+# Pairwise matrices per season, keyed by the rounds and tag tokens they were built from
+head_to_head_memo: Dict[int, Tuple[Tuple[int, ...], Dict[str, str], Dict]] = {}
+
+def normalize_jolpica_round(race_payload: Dict, qualifying_payload: Dict) -> List[Dict]:
+    """Flatten Jolpica race and qualifying results into one row per driver"""
+    races = race_payload.get("race_data") or []
+    if not races or not races[0].get("Results"):
+        return []
+    
+    qualifying_positions = {}
+    for race in qualifying_payload.get("qualifying_data") or []:
+        for result in race.get("QualifyingResults", []):
+            qualifying_positions[result["Driver"]["driverId"]] = int(result["position"])
+    
+    rows = []
+    for result in races[0]["Results"]:
+        driver = result["Driver"]
+        rows.append({
+            "driver": driver["driverId"],
+            "code": driver.get("code"),
+            "name": f"{driver.get('givenName', '')} {driver.get('familyName', '')}".strip(),
+            "constructor": result["Constructor"]["constructorId"],
+            "race_position": int(result["position"]),
+            "qualifying_position": qualifying_positions.get(driver["driverId"]),
+            "points": float(result.get("points", 0)),
+        })
+    return rows
+
+def normalize_openf1_round(race_payload: Dict, qualifying_payload: Dict) -> List[Dict]:
+    """Flatten OpenF1 race positions and classified qualifying into one row per driver"""
+    race_data = race_payload.get("race_data") or {}
+    
+    # The last position update of each driver is their finishing position
+    final_positions: Dict[int, Tuple[str, int]] = {}
+    for update in race_data.get("positions", []):
+        previous = final_positions.get(update["driver_number"])
+        if previous is None or update["date"] >= previous[0]:
+            final_positions[update["driver_number"]] = (update["date"], update["position"])
+    if not final_positions:
+        return []
+    
+    qualifying_positions = {}
+    for race in qualifying_payload.get("qualifying_data") or []:
+        for result in race.get("QualifyingResults", []):
+            qualifying_positions[int(result["number"])] = int(result["position"])
+    
+    drivers = {d["driver_number"]: d for d in race_data.get("drivers", [])}
+    rows = []
+    for driver_number, (_, position) in final_positions.items():
+        info = drivers.get(driver_number, {})
+        rows.append({
+            "driver": info.get("name_acronym") or str(driver_number),
+            "code": info.get("name_acronym"),
+            "name": info.get("full_name"),
+            "constructor": (info.get("team_name") or "").lower().replace(" ", "_"),
+            "race_position": position,
+            "qualifying_position": qualifying_positions.get(driver_number),
+            "points": float(POINTS_BY_POSITION[position - 1]) if position <= len(POINTS_BY_POSITION) else 0.0,
+        })
+    return rows
+
+# Rounds of a season loaded at once by season-wide analytics
+SEASON_ROUND_CONCURRENCY = int(os.environ.get('SEASON_ROUND_CONCURRENCY', '4'))
+
+async def load_round_results(year: int, round: int) -> List[Dict]:
+    """Normalized per-driver results of a round, empty until the race has been run"""
+    memo = round_results_memo.get((year, round))
+    if memo is not None and response_cache.is_current(memo[0]):
+        record_dependencies(memo[0])
+        return memo[1]
+    
+    with collect_dependencies() as dependencies:
+        race_payload, qualifying_payload = await asyncio.gather(
+            load_cached_payload(get_race_results, year, round),
+            load_cached_payload(get_qualifying_results, year, round),
+            return_exceptions=True
+        )
+    # Only a round upstream doesn't know yet counts as not run; any other
+    # failure must not leave a season computed without it
+    for payload in (race_payload, qualifying_payload):
+        if isinstance(payload, Exception) and not (isinstance(payload, HTTPException) and payload.status_code == 404):
+            raise payload
+    if isinstance(race_payload, Exception):
+        return []
+    if isinstance(qualifying_payload, Exception):
+        qualifying_payload = {}
+    
+    normalize = normalize_jolpica_round if year <= 2022 else normalize_openf1_round
+    rows = normalize(race_payload, qualifying_payload)
+    if rows:
+        round_results_memo[(year, round)] = (dependencies, rows)
+    return rows
+
+def pairwise_comparisons(race: "np.ndarray", qualifying: "np.ndarray", points: "np.ndarray", mask: "np.ndarray") -> Dict[str, "np.ndarray"]:
+    """Compare every driver pair over the rounds selected by a rounds x drivers x drivers mask"""
+    race_both = mask & ~np.isnan(race)[:, :, None] & ~np.isnan(race)[:, None, :]
+    qualifying_both = mask & ~np.isnan(qualifying)[:, :, None] & ~np.isnan(qualifying)[:, None, :]
+    
+    race_gap = race[:, :, None] - race[:, None, :]
+    qualifying_gap = qualifying[:, :, None] - qualifying[:, None, :]
+    race_rounds = race_both.sum(axis=0)
+    qualifying_rounds = qualifying_both.sum(axis=0)
+    
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "race_ahead": (race_both & (race_gap < 0)).sum(axis=0),
+            "qualifying_ahead": (qualifying_both & (qualifying_gap < 0)).sum(axis=0),
+            "race_rounds": race_rounds,
+            "qualifying_rounds": qualifying_rounds,
+            "points_delta": np.where(race_both, points[:, :, None] - points[:, None, :], 0).sum(axis=0),
+            "average_race_gap": np.where(race_both, race_gap, 0).sum(axis=0) / race_rounds,
+            "average_qualifying_gap": np.where(qualifying_both, qualifying_gap, 0).sum(axis=0) / qualifying_rounds,
+        }
+
+def pair_summary(comparisons: Dict[str, "np.ndarray"], driver_ids: List[str], i: int, j: int) -> Dict:
+    """Summarize one driver pair from the pairwise matrices"""
+    return {
+        "drivers": [driver_ids[i], driver_ids[j]],
+        "race_rounds": int(comparisons["race_rounds"][i, j]),
+        "race": [int(comparisons["race_ahead"][i, j]), int(comparisons["race_ahead"][j, i])],
+        "qualifying_rounds": int(comparisons["qualifying_rounds"][i, j]),
+        "qualifying": [int(comparisons["qualifying_ahead"][i, j]), int(comparisons["qualifying_ahead"][j, i])],
+        "points_delta": round_floats([comparisons["points_delta"][i, j]], 1)[0],
+        "average_race_gap": round_floats([comparisons["average_race_gap"][i, j]], 2)[0],
+        "average_qualifying_gap": round_floats([comparisons["average_qualifying_gap"][i, j]], 2)[0],
+    }
+
+def compute_head_to_head(season_rounds: Dict[int, List[Dict]]) -> Dict:
+    """Build teammate and all-pairs comparison matrices from a season of normalized results"""
+    rounds = sorted(season_rounds)
+    drivers: Dict[str, Dict] = {}
+    for round in rounds:
+        for row in season_rounds[round]:
+            drivers.setdefault(row["driver"], {"driver": row["driver"], "code": row["code"], "name": row["name"]})
+    driver_ids = list(drivers)
+    driver_index = {driver: index for index, driver in enumerate(driver_ids)}
+    constructor_ids: Dict[str, int] = {}
+    
+    # Rounds x drivers arrays, NaN (or -1 for teams) where a driver did not take part
+    shape = (len(rounds), len(driver_ids))
+    race = np.full(shape, np.nan)
+    qualifying = np.full(shape, np.nan)
+    points = np.zeros(shape)
+    team = np.full(shape, -1, dtype=np.int64)
+    for r, round in enumerate(rounds):
+        for row in season_rounds[round]:
+            d = driver_index[row["driver"]]
+            race[r, d] = row["race_position"]
+            qualifying[r, d] = np.nan if row["qualifying_position"] is None else row["qualifying_position"]
+            points[r, d] = row["points"]
+            team[r, d] = constructor_ids.setdefault(row["constructor"], len(constructor_ids))
+    
+    entered = team >= 0
+    teammates_mask = entered[:, :, None] & (team[:, :, None] == team[:, None, :])
+    teammates = pairwise_comparisons(race, qualifying, points, teammates_mask)
+    all_pairs = pairwise_comparisons(race, qualifying, points, entered[:, :, None] & entered[:, None, :])
+    
+    teams = {index: constructor for constructor, index in constructor_ids.items()}
+    shared_rounds = teammates_mask.sum(axis=0)
+    pairs = []
+    for i, j in zip(*np.nonzero(np.triu(shared_rounds, k=1))):
+        summary = pair_summary(teammates, driver_ids, int(i), int(j))
+        shared_teams = np.unique(team[:, i][teammates_mask[:, i, j]])
+        summary["constructors"] = [teams[int(t)] for t in shared_teams]
+        pairs.append(summary)
+    
+    return {
+        "rounds": rounds,
+        "drivers": list(drivers.values()),
+        "teammates": pairs,
+        "all_pairs": all_pairs,
+    }
+
+@app.get("/api/seasons/{year}/head-to-head")
+@cached_response("head_to_head:{year}:{all_pairs}:{drivers}", tags=("season:{year}",))
+async def get_head_to_head(year: int, all_pairs: bool = False, drivers: Optional[str] = None):
+    """Get teammate (and optionally any driver pair) head-to-head comparisons for a season"""
+    try:
+        season = await load_cached_payload(get_season_details, year)
+        total_rounds = season.get("total_races", 0)
+        
+        semaphore = asyncio.Semaphore(SEASON_ROUND_CONCURRENCY)
+        
+        async def load_round(round: int) -> List[Dict]:
+            async with semaphore:
+                return await load_round_results(year, round)
+        
+        results = await asyncio.gather(*[load_round(round) for round in range(1, total_rounds + 1)])
+        season_rounds = {round: rows for round, rows in enumerate(results, start=1) if rows}
+        
+        # Reuse the matrices until a round has been ingested or invalidated
+        signature = tuple(season_rounds)
+        memo = head_to_head_memo.get(year)
+        if memo is None or memo[0] != signature or not response_cache.is_current(memo[1]):
+            memo = (signature, dict(cache_dependencies.get() or {}), compute_head_to_head(season_rounds))
+            head_to_head_memo[year] = memo
+        head_to_head = memo[2]
+        
+        driver_ids = [d["driver"] for d in head_to_head["drivers"]]
+        response = {
+            "year": year,
+            "rounds": head_to_head["rounds"],
+            "drivers": head_to_head["drivers"],
+            "teammates": head_to_head["teammates"],
+            "data_source": "jolpica" if year <= 2022 else "openf1"
+        }
+        
+        if drivers:
+            lookup = {}
+            for index, driver in enumerate(head_to_head["drivers"]):
+                for key in (driver["driver"], driver["code"]):
+                    if key:
+                        lookup[key.lower()] = index
+            pair = [lookup.get(d.strip().lower()) for d in drivers.split(",")]
+            if len(pair) != 2 or None in pair:
+                raise HTTPException(status_code=400, detail="drivers must name two drivers of the season, e.g. drivers=VER,HAM")
+            response["pair"] = pair_summary(head_to_head["all_pairs"], driver_ids, pair[0], pair[1])
+        
+        if all_pairs:
+            response["matrices"] = {
+                "race_ahead": head_to_head["all_pairs"]["race_ahead"],
+                "qualifying_ahead": head_to_head["all_pairs"]["qualifying_ahead"],
+                "points_delta": np.round(head_to_head["all_pairs"]["points_delta"], 1),
+                "average_race_gap": [round_floats(row, 2) for row in head_to_head["all_pairs"]["average_race_gap"]],
+                "average_qualifying_gap": [round_floats(row, 2) for row in head_to_head["all_pairs"]["average_qualifying_gap"]],
+            }
+        
+        return response
+    except HTTPException:
+        raise
+    except requests.RequestException as e:
+        logger.error(f"API request error: {e}")
+        raise HTTPException(status_code=500, detail="External API error")
+    except Exception as e:
+        logger.error(f"Error computing head-to-head for {year}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Car telemetry channels and the compact dtypes they are stored in
+TELEMETRY_CHANNELS = {
+    "speed": "uint16",
+    "throttle": "uint8",
+    "brake": "uint8",
+    "n_gear": "uint8",
+    "rpm": "uint16",
+    "drs": "uint8",
+}
+
+# Telemetry is stored in chunks covering this many milliseconds; sample
+# times are kept as uint16 offsets from the chunk start, so it must stay
+# below 65536
+TELEMETRY_CHUNK_MS = 60_000
+
+# Most car_data a single upstream request asks OpenF1 for
+TELEMETRY_FETCH_MS = 10 * TELEMETRY_CHUNK_MS
+
+# A chunk that ended this long ago is not expected to gain samples
+TELEMETRY_SETTLE_MS = 120_000
+
+# Upper bound on buckets returned by a downsampled telemetry query
+TELEMETRY_MAX_BUCKETS = 5000
+
+def to_epoch_ms(timestamps: "pd.Series") -> "np.ndarray":
+    """Convert ISO timestamps to integer milliseconds since the epoch"""
+    parsed = pd.to_datetime(timestamps, utc=True, format="ISO8601")
+    return ((parsed - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(milliseconds=1)).to_numpy(dtype="int64")
+
+def encode_telemetry_chunk(start: int, times: "np.ndarray", channels: Dict[str, "np.ndarray"]) -> Dict:
+    """Pack one chunk of samples into zlib-compressed column buffers"""
+    columns = {"t": zlib.compress((times - start).astype("uint16").tobytes())}
+    for channel, dtype in TELEMETRY_CHANNELS.items():
+        columns[channel] = zlib.compress(channels[channel].astype(dtype).tobytes())
+    return {"start": start, "end": int(times[-1]), "count": int(len(times)), "columns": columns}
+
+def decode_telemetry_chunk(chunk: Dict) -> Tuple["np.ndarray", Dict[str, "np.ndarray"]]:
+    """Unpack a stored chunk back into sample times (epoch ms) and channel arrays"""
+    columns = chunk["columns"]
+    times = np.frombuffer(zlib.decompress(columns["t"]), dtype="uint16").astype("int64") + chunk["start"]
+    channels = {
+        channel: np.frombuffer(zlib.decompress(columns[channel]), dtype=dtype)
+        for channel, dtype in TELEMETRY_CHANNELS.items()
+    }
+    return times, channels
+
+def car_data_columns(rows: List[Dict]) -> Tuple["np.ndarray", Dict[str, "np.ndarray"]]:
+    """Turn OpenF1 car_data rows into sorted sample times and channel arrays"""
+    df = pd.DataFrame.from_records(rows, columns=["date"] + list(TELEMETRY_CHANNELS)).dropna(subset=["date"])
+    times = to_epoch_ms(df["date"])
+    order = np.argsort(times, kind="stable")
+    channels = {
+        channel: pd.to_numeric(df[channel], errors="coerce").fillna(0).clip(lower=0).to_numpy()[order]
+        for channel in TELEMETRY_CHANNELS
+    }
+    return times[order], channels
+
+async def sync_car_data(session: Dict, driver_number: int, start: int, end: int):
+    """Ingest the OpenF1 car_data chunks covering a time window that aren't stored yet.
+
+    Only the window is fetched, a few minutes of samples per request, and each
+    request's chunks are written as soon as they arrive, so a window too large
+    for one request's budget is backfilled by the ones that follow. Chunks
+    that may still gain samples are refetched after SESSION_SYNC_INTERVAL.
+    """
+    session_key = session["session_key"]
+    now = datetime.now(timezone.utc)
+    wanted = list(range(start - start % TELEMETRY_CHUNK_MS, end + 1, TELEMETRY_CHUNK_MS))
+    stored = {
+        chunk["start"]: chunk
+        for chunk in await db.telemetry_chunks.find(
+            {"session_key": session_key, "driver_number": driver_number, "start": {"$in": wanted}},
+            {"start": 1, "complete": 1, "fetched_at": 1}
+        ).to_list(None)
+    }
+    missing = [
+        chunk_start for chunk_start in wanted
+        if chunk_start not in stored or not (
+            stored[chunk_start].get("complete")
+            or (now - stored[chunk_start]["fetched_at"].replace(tzinfo=timezone.utc)).total_seconds() < SESSION_SYNC_INTERVAL
+        )
+    ]
+    if not missing:
+        return
+    
+    # Group the missing chunks into contiguous ranges of at most TELEMETRY_FETCH_MS
+    ranges = [[missing[0]]]
+    for chunk_start in missing[1:]:
+        current = ranges[-1]
+        if chunk_start == current[-1] + TELEMETRY_CHUNK_MS and chunk_start + TELEMETRY_CHUNK_MS - current[0] <= TELEMETRY_FETCH_MS:
+            current.append(chunk_start)
+        else:
+            ranges.append([chunk_start])
+    
+    session_end = session.get("date_end")
+    final = bool(session_end) and (now - datetime.fromisoformat(session_end)).total_seconds() > SESSION_FINAL_AFTER
+    settled_before = now.timestamp() * 1000 - TELEMETRY_SETTLE_MS
+    for chunk_starts in ranges:
+        since = datetime.fromtimestamp(chunk_starts[0] / 1000, timezone.utc).isoformat()
+        until = datetime.fromtimestamp((chunk_starts[-1] + TELEMETRY_CHUNK_MS) / 1000, timezone.utc).isoformat()
+        status, body = await fetch_upstream(
+            f"{OPENF1_BASE_URL}/car_data?session_key={session_key}&driver_number={driver_number}"
+            f"&date>={quote(since)}&date<{quote(until)}",
+            cache=False
+        )
+        rows = openf1_sync_rows(status, body)
+        if rows is None:
+            raise upstream_error(status, "Car data not found")
+        
+        if rows:
+            times, channels = car_data_columns(rows)
+        else:
+            times, channels = np.empty(0, dtype="int64"), {channel: np.empty(0, dtype=dtype) for channel, dtype in TELEMETRY_CHANNELS.items()}
+        bounds = np.searchsorted(times, chunk_starts + [chunk_starts[-1] + TELEMETRY_CHUNK_MS])
+        operations = []
+        for chunk_start, lo, hi in zip(chunk_starts, bounds[:-1], bounds[1:]):
+            # Empty chunks are stored too, so gaps in the data aren't refetched
+            chunk = encode_telemetry_chunk(
+                chunk_start, times[lo:hi], {channel: values[lo:hi] for channel, values in channels.items()}
+            ) if hi > lo else {"start": chunk_start, "end": chunk_start, "count": 0, "columns": None}
+            chunk["complete"] = final or chunk_start + TELEMETRY_CHUNK_MS < settled_before
+            chunk["fetched_at"] = now
+            operations.append(UpdateOne(
+                {"session_key": session_key, "driver_number": driver_number, "start": chunk_start},
+                {"$set": chunk},
+                upsert=True
+            ))
+        await db.telemetry_chunks.bulk_write(operations, ordered=False)
+
+async def load_telemetry(session: Dict, driver_number: int, start: int, end: int) -> Tuple["np.ndarray", Dict[str, "np.ndarray"]]:
+    """Get a driver's telemetry samples between two epoch-ms instants"""
+    session_key = session["session_key"]
+    if session_store() is not None:
+        try:
+            lock = session_sync_locks.setdefault((session_key, f"car_data:{driver_number}"), asyncio.Lock())
+            async with lock:
+                await sync_car_data(session, driver_number, start, end)
+            
+            chunks = await db.telemetry_chunks.find({
+                "session_key": session_key,
+                "driver_number": driver_number,
+                "start": {"$gt": start - TELEMETRY_CHUNK_MS, "$lte": end},
+                "count": {"$gt": 0}
+            }, {"_id": 0}).sort("start", ASCENDING).to_list(None)
+            decoded = [decode_telemetry_chunk(chunk) for chunk in chunks]
+            times = np.concatenate([d[0] for d in decoded]) if decoded else np.empty(0, dtype="int64")
+            channels = {
+                channel: np.concatenate([d[1][channel] for d in decoded]) if decoded else np.empty(0, dtype=dtype)
+                for channel, dtype in TELEMETRY_CHANNELS.items()
+            }
+        except PyMongoError as e:
+            session_store_failed(e, f"Telemetry store unavailable, fetching car_data for {session_key} directly")
+            times = None
+        if times is not None:
+            window = (times >= start) & (times <= end)
+            return times[window], {channel: values[window] for channel, values in channels.items()}
+    
+    # Without the store, ask OpenF1 for just the requested window
+    since = quote(datetime.fromtimestamp(start / 1000, timezone.utc).isoformat())
+    until = quote(datetime.fromtimestamp(end / 1000, timezone.utc).isoformat())
+    status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/car_data?session_key={session_key}&driver_number={driver_number}&date>={since}&date<={until}")
+    rows = orjson.loads(body) if status == 200 else []
+    if not rows:
+        return np.empty(0, dtype="int64"), {channel: np.empty(0, dtype=dtype) for channel, dtype in TELEMETRY_CHANNELS.items()}
+    return car_data_columns(rows)
+
+def downsample_telemetry(times: "np.ndarray", channels: Dict[str, "np.ndarray"], origin: int, resolution_ms: int) -> Dict:
+    """Reduce samples to min/max/mean per time bucket"""
+    buckets = (times - origin) // resolution_ms
+    starts = np.flatnonzero(np.r_[True, np.diff(buckets) != 0]) if len(times) else np.empty(0, dtype="int64")
+    counts = np.diff(np.r_[starts, len(times)])
+    
+    result = {"t": round_floats((buckets[starts] * resolution_ms) / 1000)}
+    for channel, values in channels.items():
+        values = values.astype("float64")
+        result[channel] = {
+            "min": np.minimum.reduceat(values, starts).tolist() if len(starts) else [],
+            "max": np.maximum.reduceat(values, starts).tolist() if len(starts) else [],
+            "mean": round_floats(np.add.reduceat(values, starts) / counts, 1) if len(starts) else [],
+        }
+    return result
+
+def parse_telemetry_bound(value: Optional[str], session_start: int) -> Optional[int]:
+    """Read a from/to bound given as seconds into the session or an ISO timestamp"""
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            return int(to_epoch_ms(pd.Series([value]))[0])
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail=f"Invalid time '{value}'")
+    if not np.isfinite(seconds):
+        raise HTTPException(status_code=400, detail=f"Invalid time '{value}'")
+    return session_start + int(seconds * 1000)
+
+@app.get("/api/races/{year}/{round}/telemetry/{driver_number}")
+@admission("heavy")
+async def get_car_telemetry(
+    year: int,
+    round: int,
+    driver_number: int,
+    session: str = "race",
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    resolution: Optional[float] = None,
+    lap: Optional[int] = None
+):
+    """Get a driver's car telemetry over a time window or lap, optionally downsampled.
+
+    ``from``/``to`` are seconds into the session or ISO timestamps, ``lap``
+    selects a single lap and ``resolution`` is the bucket width in seconds.
+    Windows with more than TELEMETRY_MAX_BUCKETS samples are always
+    downsampled.
+    """
+    try:
+        if year <= 2022:
+            raise HTTPException(status_code=404, detail="Car telemetry is only available from 2023")
+        
+        session_name = OPENF1_SESSION_NAMES.get(session.lower())
+        if session_name is None:
+            raise HTTPException(status_code=400, detail=f"Unknown session '{session}'")
+        
+        race_meeting, race_session = await get_openf1_session(year, round, session_name)
+        session_start = int(to_epoch_ms(pd.Series([race_session["date_start"]]))[0])
+        session_end = int(to_epoch_ms(pd.Series([race_session["date_end"]]))[0]) if race_session.get("date_end") else None
+        
+        if lap is not None:
+            laps = [row for row in await fetch_session_rows(race_session, "laps")
+                    if row.get("driver_number") == driver_number and row.get("lap_number") == lap]
+            if not laps or not laps[0].get("date_start") or not laps[0].get("lap_duration"):
+                raise HTTPException(status_code=404, detail=f"Lap {lap} not found for car {driver_number}")
+            window_start = int(to_epoch_ms(pd.Series([laps[0]["date_start"]]))[0])
+            window_end = window_start + int(laps[0]["lap_duration"] * 1000)
+        else:
+            window_start = parse_telemetry_bound(start, session_start) or session_start
+            window_end = parse_telemetry_bound(end, session_start) or session_end or window_start + TELEMETRY_CHUNK_MS
+        if window_end <= window_start:
+            raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+        
+        # Keep responses bounded: raw samples only while they fit in TELEMETRY_MAX_BUCKETS
+        resolution_ms = int(resolution * 1000) if resolution else 0
+        resolution_ms = max(resolution_ms, -(-(window_end - window_start) // TELEMETRY_MAX_BUCKETS))
+        
+        times, channels = await load_telemetry(race_session, driver_number, window_start, window_end)
+        downsampled = bool(resolution) or len(times) > TELEMETRY_MAX_BUCKETS
+        if downsampled:
+            telemetry = downsample_telemetry(times, channels, window_start, resolution_ms)
+        else:
+            telemetry = {"t": round_floats((times - window_start) / 1000), **{c: v.tolist() for c, v in channels.items()}}
+        
+        return ORJSONResponse({
+            "year": year,
+            "round": round,
+            "session_key": race_session["session_key"],
+            "driver_number": driver_number,
+            "lap": lap,
+            "from": datetime.fromtimestamp(window_start / 1000, timezone.utc).isoformat(),
+            "to": datetime.fromtimestamp(window_end / 1000, timezone.utc).isoformat(),
+            "resolution": resolution_ms / 1000 if downsampled else None,
+            "samples": int(len(times)),
+            "telemetry": telemetry,
+            "data_source": "openf1"
+        })
+    except HTTPException:
+        raise
+    except requests.RequestException as e:
+        logger.error(f"API request error: {e}")
+        raise HTTPException(status_code=500, detail="External API error")
+    except Exception as e:
+        logger.error(f"Error getting telemetry for {year}/{round} car {driver_number}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Track maps are simplified to this tolerance, in OpenF1 location units
+TRACK_MAP_TOLERANCE = float(os.environ.get('TRACK_MAP_TOLERANCE', '8'))
+TRACK_MAP_TTL = 7 * 24 * 3600
+
+# Replay frames: bucket width, the aligned chunks location data is fetched
+# and cached in, and the longest window one request may ask for
+REPLAY_BUCKET_MS = 250
+REPLAY_CHUNK_MS = 60000
+REPLAY_WINDOW_MS = 60000
+REPLAY_MAX_WINDOW_MS = 600000
+
+# Chunks this recent may still be filling up on a live session, so they aren't cached
+REPLAY_SETTLE_MS = 60000
+
+def simplify_polyline(points: "np.ndarray", tolerance: float) -> "np.ndarray":
+    """Ramer-Douglas-Peucker simplification of an (n, 2) polyline, closed or open"""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        origin = points[first]
+        segment = points[last] - origin
+        inner = points[first + 1:last] - origin
+        length = np.hypot(*segment)
+        if length:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        else:
+            # A closed lap starts and ends in the same place
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.extend([(first, split), (split, last)])
+    return points[keep]
+
+async def derive_circuit_map(circuit_key: int, session: Dict) -> Dict:
+    """Trace a circuit from the car positions of the fastest clean lap of a session"""
+    laps = [
+        lap for lap in await fetch_session_rows(session, "laps")
+        if lap.get("lap_duration") and lap.get("date_start") and not lap.get("is_pit_out_lap") and (lap.get("lap_number") or 0) > 1
+    ]
+    if not laps:
+        raise HTTPException(status_code=404, detail="No timed laps to trace the circuit from")
+    lap = min(laps, key=lambda lap: lap["lap_duration"])
+    
+    started = datetime.fromisoformat(lap["date_start"])
+    finished = started + timedelta(seconds=lap["lap_duration"])
+    status, body = await fetch_upstream(
+        f"{OPENF1_BASE_URL}/location?session_key={session['session_key']}&driver_number={lap['driver_number']}"
+        f"&date>={quote(started.isoformat())}&date<={quote(finished.isoformat())}",
+        cache=False
+    )
+    # Cars report the origin while their position is unknown
+    samples = [(row["x"], row["y"]) for row in (orjson.loads(body) if status == 200 else []) if row.get("x") or row.get("y")]
+    if len(samples) < 3:
+        raise HTTPException(status_code=404, detail="No location data to trace the circuit from")
+    
+    points = np.asarray(samples, dtype=float)
+    outline = simplify_polyline(points, TRACK_MAP_TOLERANCE)
+    return {
+        "circuit_key": circuit_key,
+        "circuit_short_name": session.get("circuit_short_name"),
+        "points": outline.round().astype(int).tolist(),
+        "bounds": {"x": [int(points[:, 0].min()), int(points[:, 0].max())], "y": [int(points[:, 1].min()), int(points[:, 1].max())]},
+        "raw_points": len(points),
+        "tolerance": TRACK_MAP_TOLERANCE,
+        "source": {"session_key": session["session_key"], "year": session.get("year"), "driver_number": lap["driver_number"], "lap_number": lap["lap_number"]},
+    }
+
+@cached_response("circuit_map:{circuit_key}", ttl=TRACK_MAP_TTL, route_class="heavy")
+async def load_circuit_map(circuit_key: int) -> Dict:
+    """A circuit's outline, traced once from its latest completed race and kept in MongoDB"""
+    if session_store() is not None:
+        try:
+            stored = await db.circuit_maps.find_one({"circuit_key": circuit_key}, {"_id": 0})
+            if stored:
+                return stored
+        except PyMongoError as e:
+            session_store_failed(e, "Circuit map store unavailable")
+    
+    status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/sessions?circuit_key={circuit_key}&session_name=Race")
+    now = datetime.now(timezone.utc).isoformat()
+    sessions = [s for s in (orjson.loads(body) if status == 200 else []) if s.get("date_end") and s["date_end"] < now]
+    if not sessions:
+        raise HTTPException(status_code=404, detail="No completed race at this circuit yet")
+    
+    circuit_map = await derive_circuit_map(circuit_key, max(sessions, key=lambda s: s["date_start"]))
+    if session_store() is not None:
+        try:
+            await db.circuit_maps.replace_one({"circuit_key": circuit_key}, dict(circuit_map), upsert=True)
+        except PyMongoError as e:
+            session_store_failed(e, f"Could not store circuit map {circuit_key}")
+    return circuit_map
+
+@app.get("/api/races/{year}/{round}/track-map")
+async def get_track_map(year: int, round: int):
+    """Get the simplified outline of a round's circuit, shared by every season raced there"""
+    try:
+        if year <= 2022:
+            raise HTTPException(status_code=404, detail="Track maps are only available from 2023")
+        
+        race_meeting, _ = await get_openf1_session(year, round, "Race")
+        return await load_circuit_map(race_meeting["circuit_key"])
+    except HTTPException:
+        raise
+    except requests.RequestException as e:
+        logger.error(f"API request error: {e}")
+        raise HTTPException(status_code=500, detail="External API error")
+    except Exception as e:
+        logger.error(f"Error getting track map for {year}/{round}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def build_replay_chunk(session_key: int, start: int, bucket_ms: int) -> Dict:
+    """Every car's last position in each bucket of one REPLAY_CHUNK_MS chunk of a session"""
+    since = datetime.fromtimestamp(start / 1000, timezone.utc).isoformat()
+    until = datetime.fromtimestamp((start + REPLAY_CHUNK_MS) / 1000, timezone.utc).isoformat()
+    status, body = await fetch_upstream(
+        f"{OPENF1_BASE_URL}/location?session_key={session_key}&date>={quote(since)}&date<{quote(until)}",
+        cache=False
+    )
+    rows = orjson.loads(body) if status == 200 else []
+    samples = pd.DataFrame(rows, columns=["driver_number", "date", "x", "y"])
+    samples = samples[(samples["x"] != 0) | (samples["y"] != 0)]
+    if samples.empty:
+        return {"start": start, "cars": {}}
+    
+    samples["t"] = to_epoch_ms(samples["date"])
+    samples["bucket"] = (samples["t"] - start) // bucket_ms
+    last = samples.sort_values("t").groupby(["driver_number", "bucket"])[["x", "y"]].last()
+    cars = {}
+    for driver_number, car in last.groupby(level=0):
+        cars[str(driver_number)] = {
+            "bucket": car.index.get_level_values(1).tolist(),
+            "x": car["x"].round().astype(int).tolist(),
+            "y": car["y"].round().astype(int).tolist(),
+        }
+    return {"start": start, "cars": cars}
+
+load_replay_chunk = cached_response("replay_chunk:{session_key}:{start}:{bucket_ms}", route_class="heavy")(build_replay_chunk)
+
+def delta_encode(values: "np.ndarray") -> List[int]:
+    """First value followed by the difference to each previous one"""
+    values = np.rint(values).astype(np.int64)
+    return np.concatenate([values[:1], np.diff(values)]).tolist()
+
+def assemble_replay(chunks: List[Dict], window_start: int, frames: int, bucket_ms: int) -> Dict[str, Dict[str, List[int]]]:
+    """Lay chunk samples on one bucket grid per car, holding positions over missing buckets"""
+    grids: Dict[str, "np.ndarray"] = {}
+    for chunk in chunks:
+        offset = (chunk["start"] - window_start) // bucket_ms
+        for driver_number, car in chunk["cars"].items():
+            index = np.asarray(car["bucket"], dtype=np.int64) + offset
+            inside = (index >= 0) & (index < frames)
+            grid = grids.setdefault(driver_number, np.full((2, frames), np.nan))
+            grid[0, index[inside]] = np.asarray(car["x"])[inside]
+            grid[1, index[inside]] = np.asarray(car["y"])[inside]
+    
+    cars = {}
+    for driver_number, grid in grids.items():
+        if np.isnan(grid[0]).all():
+            continue
+        filled = pd.DataFrame(grid.T).ffill().bfill().to_numpy()
+        cars[driver_number] = {"x": delta_encode(filled[:, 0]), "y": delta_encode(filled[:, 1])}
+    return cars
+
+@app.get("/api/races/{year}/{round}/replay")
+@admission("heavy")
+async def get_race_replay(
+    year: int,
+    round: int,
+    session: str = "race",
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    lap: Optional[int] = None,
+    bucket_ms: int = REPLAY_BUCKET_MS
+):
+    """Get every car's position over a time window or lap, as delta-encoded frames.
+
+    ``from``/``to`` are seconds into the session or ISO timestamps and
+    ``lap`` selects the leader's lap. Each car's ``x`` and ``y`` hold the
+    position at the first frame followed by the change at every next one,
+    one frame per ``bucket_ms``.
+    """
+    try:
+        if year <= 2022:
+            raise HTTPException(status_code=404, detail="Replays are only available from 2023")
+        if bucket_ms < 50 or REPLAY_CHUNK_MS % bucket_ms:
+            raise HTTPException(status_code=400, detail=f"bucket_ms must be at least 50 and divide {REPLAY_CHUNK_MS}")
+        
+        session_name = OPENF1_SESSION_NAMES.get(session.lower())
+        if session_name is None:
+            raise HTTPException(status_code=400, detail=f"Unknown session '{session}'")
+        
+        race_meeting, race_session = await get_openf1_session(year, round, session_name)
+        session_start = int(to_epoch_ms(pd.Series([race_session["date_start"]]))[0])
+        
+        if lap is not None:
+            laps = [row for row in await fetch_session_rows(race_session, "laps") if row.get("date_start")]
+            starts = to_epoch_ms(pd.Series([row["date_start"] for row in laps])) if laps else np.array([])
+            numbers = np.array([row.get("lap_number") or 0 for row in laps])
+            if not (numbers == lap).any():
+                raise HTTPException(status_code=404, detail=f"Lap {lap} not found")
+            window_start = int(starts[numbers == lap].min())
+            following = starts[numbers == lap + 1]
+            durations = [row["lap_duration"] for row in laps if row.get("lap_number") == lap and row.get("lap_duration")]
+            window_end = int(following.min()) if following.size else window_start + int(max(durations, default=REPLAY_WINDOW_MS / 1000) * 1000)
+        else:
+            window_start = parse_telemetry_bound(start, session_start) or session_start
+            window_end = parse_telemetry_bound(end, session_start) or window_start + REPLAY_WINDOW_MS
+        if window_end <= window_start:
+            raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+        if window_end - window_start > REPLAY_MAX_WINDOW_MS:
+            raise HTTPException(status_code=400, detail=f"Replay windows are limited to {REPLAY_MAX_WINDOW_MS // 1000} seconds")
+        
+        # Frames sit on a grid of whole buckets, which chunk boundaries fall on too
+        window_start -= window_start % bucket_ms
+        frames = -(-(window_end - window_start) // bucket_ms)
+        settled_before = time.time() * 1000 - REPLAY_SETTLE_MS
+        
+        async def chunk(chunk_start: int) -> Dict:
+            if chunk_start + REPLAY_CHUNK_MS <= settled_before:
+                return await load_cached_payload(load_replay_chunk, race_session["session_key"], chunk_start, bucket_ms)
+            return await build_replay_chunk(race_session["session_key"], chunk_start, bucket_ms)
+        
+        first_chunk = window_start - window_start % REPLAY_CHUNK_MS
+        chunks, drivers = await asyncio.gather(
+            asyncio.gather(*[chunk(chunk_start) for chunk_start in range(first_chunk, window_end, REPLAY_CHUNK_MS)]),
+            fetch_session_rows(race_session, "drivers")
+        )
+        
+        driver_info = {str(d.get("driver_number")): d for d in drivers}
+        cars = [
+            {
+                "driver_number": int(driver_number),
+                "name_acronym": driver_info.get(driver_number, {}).get("name_acronym"),
+                "team_colour": driver_info.get(driver_number, {}).get("team_colour"),
+                **positions
+            }
+            for driver_number, positions in sorted(assemble_replay(chunks, window_start, frames, bucket_ms).items(), key=lambda item: int(item[0]))
+        ]
+        
+        return ORJSONResponse({
+            "year": year,
+            "round": round,
+            "session_key": race_session["session_key"],
+            "circuit_key": race_meeting.get("circuit_key"),
+            "lap": lap,
+            "from": datetime.fromtimestamp(window_start / 1000, timezone.utc).isoformat(),
+            "to": datetime.fromtimestamp((window_start + frames * bucket_ms) / 1000, timezone.utc).isoformat(),
+            "next_from": (window_start + frames * bucket_ms - session_start) / 1000,
+            "bucket_ms": bucket_ms,
+            "frames": frames,
+            "encoding": "delta",
+            "cars": cars,
+            "data_source": "openf1"
+        })
+    except HTTPException:
+        raise
+    except requests.RequestException as e:
+        logger.error(f"API request error: {e}")
+        raise HTTPException(status_code=500, detail="External API error")
+    except Exception as e:
+        logger.error(f"Error getting replay for {year}/{round}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Columns and Arrow types of the bulk export tables. Standings are Jolpica's
+# own per-round tables (sprints included); OpenF1 has none, so for its
+# seasons they are summed from race finishes only, which points_basis says.
+EXPORT_TABLES = {
+    "results": [
+        ("year", "int16"), ("round", "int16"), ("driver", "string"), ("code", "string"), ("name", "string"),
+        ("constructor", "string"), ("qualifying_position", "int16"), ("race_position", "int16"), ("points", "double"),
+    ],
+    "qualifying": [
+        ("year", "int16"), ("round", "int16"), ("position", "int16"), ("driver", "string"), ("number", "string"),
+        ("code", "string"), ("constructor", "string"), ("q1", "string"), ("q2", "string"), ("q3", "string"),
+    ],
+    "laps": [
+        ("year", "int16"), ("round", "int16"), ("driver", "string"), ("lap", "int16"), ("position", "int16"), ("time", "double"),
+    ],
+    "standings": [
+        ("year", "int16"), ("round", "int16"), ("position", "int16"), ("driver", "string"), ("code", "string"),
+        ("name", "string"), ("constructor", "string"), ("points", "double"), ("wins", "int16"), ("points_basis", "string"),
+    ],
+}
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Rows buffered per written batch (one Parquet row group); bounds export memory
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', '10000'))
+
+# Parquet exports need pyarrow, which is optional
+pa = LazyModule("pyarrow")
+pq = LazyModule("pyarrow.parquet")
+
+def parse_years(years: str) -> List[int]:
+    """Parse a season list such as "2018-2024" or "2010,2015-2017" """
+    current_year = datetime.now().year
+    selected = set()
+    try:
+        for part in years.split(","):
+            first, _, last = part.strip().partition("-")
+            selected.update(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid seasons '{years}'")
+    if not selected or min(selected) < 2005 or max(selected) > current_year:
+        raise HTTPException(status_code=400, detail=f"Seasons must be between 2005 and {current_year}")
+    return sorted(selected)
+
+async def export_qualifying_rows(year: int, round: int) -> List[Dict]:
+    payload = await load_cached_payload(get_qualifying_results, year, round)
+    return [
+        {
+            "year": year,
+            "round": round,
+            "position": int(result["position"]),
+            "driver": result["Driver"]["driverId"],
+            "number": result.get("number"),
+            "code": result["Driver"].get("code"),
+            "constructor": result["Constructor"]["constructorId"],
+            "q1": result.get("Q1"),
+            "q2": result.get("Q2"),
+            "q3": result.get("Q3"),
+        }
+        for race in payload.get("qualifying_data") or []
+        for result in race.get("QualifyingResults", [])
+    ]
+
+async def export_lap_rows(year: int, round: int) -> List[Dict]:
+    if year <= 2022:
+        laps = pd.DataFrame(await fetch_jolpica_laps(year, round))
+        if laps.empty:
+            return []
+        times = parse_lap_times(laps["time"])
+        return [
+            {"year": year, "round": round, "driver": driver, "lap": lap, "position": position, "time": seconds}
+            for driver, lap, position, seconds in zip(
+                laps["driverId"].tolist(), laps["lap"].tolist(), laps["position"].tolist(),
+                times.astype(object).where(times.notna(), None).tolist()
+            )
+        ]
+    
+    _, race_session = await get_openf1_session(year, round, "Race")
+    laps, drivers = await asyncio.gather(
+        fetch_session_rows(race_session, "laps"),
+        fetch_session_rows(race_session, "drivers")
+    )
+    acronyms = {d.get("driver_number"): d.get("name_acronym") for d in drivers}
+    return [
+        {
+            "year": year,
+            "round": round,
+            "driver": acronyms.get(lap["driver_number"]) or str(lap["driver_number"]),
+            "lap": lap.get("lap_number"),
+            "position": None,
+            "time": lap.get("lap_duration"),
+        }
+        for lap in laps
+    ]
+
+async def export_standings_rows(year: int, round: int) -> List[Dict]:
+    """Jolpica's drivers' championship after a round"""
+    status, body = await fetch_upstream(f"{JOLPICA_BASE_URL}/{year}/{round}/driverStandings.json")
+    if status != 200:
+        raise upstream_error(status, "Standings not found")
+    standings_lists = orjson.loads(body)["MRData"]["StandingsTable"]["StandingsLists"]
+    if not standings_lists or standings_lists[0].get("round") != str(round):
+        return []
+    
+    rows = []
+    for standing in standings_lists[0]["DriverStandings"]:
+        driver = standing["Driver"]
+        constructors = standing.get("Constructors") or [{}]
+        rows.append({
+            "year": year,
+            "round": round,
+            "position": int(standing["position"]) if standing.get("position") else None,
+            "driver": driver["driverId"],
+            "code": driver.get("code"),
+            "name": f"{driver.get('givenName', '')} {driver.get('familyName', '')}".strip(),
+            "constructor": constructors[-1].get("constructorId"),
+            "points": float(standing.get("points", 0)),
+            "wins": int(standing.get("wins", 0)),
+            "points_basis": "official",
+        })
+    return rows
+
+def accumulate_standings(totals: Dict[str, Dict], year: int, round: int, results: List[Dict]) -> List[Dict]:
+    """Add a round's race finishes to the running totals and rank the championship after it"""
+    if not results:
+        return []
+    for row in results:
+        entry = totals.setdefault(row["driver"], {"driver": row["driver"], "points": 0.0, "wins": 0, "points_basis": "race_finishes"})
+        entry.update(code=row["code"], name=row["name"], constructor=row["constructor"])
+        entry["points"] += row["points"]
+        entry["wins"] += row["race_position"] == 1
+    
+    ranked = sorted(totals.values(), key=lambda entry: (-entry["points"], -entry["wins"]))
+    return [{"year": year, "round": round, "position": position, **entry} for position, entry in enumerate(ranked, start=1)]
+
+def round_started(race: Dict) -> bool:
+    """Whether a calendar entry (a Jolpica race or an OpenF1 meeting) has begun"""
+    start = race.get("date_start") or race.get("date")
+    return bool(start) and start[:10] <= datetime.now(timezone.utc).date().isoformat()
+
+async def export_season_rows(table: str, year: int):
+    """Yield a season's rows of an export table one round at a time.
+
+    Rounds that haven't started yet are skipped, and so are rounds upstream
+    has no data for; any other failure aborts the export rather than leave
+    a round out of it.
+    """
+    season = await load_cached_payload(get_season_details, year)
+    standings: Dict[str, Dict] = {}
+    for round, race in enumerate(season.get("races", []), start=1):
+        if not round_started(race):
+            break
+        try:
+            if table == "qualifying":
+                rows = await export_qualifying_rows(year, round)
+            elif table == "laps":
+                rows = await export_lap_rows(year, round)
+            elif table == "standings" and year <= 2022:
+                rows = await export_standings_rows(year, round)
+            else:
+                results = await load_round_results(year, round)
+                if table == "standings":
+                    rows = accumulate_standings(standings, year, round, results)
+                else:
+                    rows = [{"year": year, "round": round, **row} for row in results]
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+            rows = []
+        if rows:
+            yield rows
+
+async def export_batches(table: str, years: List[int]):
+    """Group the rows of every requested season into batches of about EXPORT_BATCH_ROWS"""
+    batch: List[Dict] = []
+    for year in years:
+        async for rows in export_season_rows(table, year):
+            batch.extend(rows)
+            if len(batch) >= EXPORT_BATCH_ROWS:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+class ExportSink:
+    """Write-only file object handing over what a writer produced since the last drain"""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+async def stream_export(table: str, years: List[int], format: str):
+    """Encode the export batch by batch, yielding bytes as soon as each batch is written"""
+    columns = EXPORT_TABLES[table]
+    names = [name for name, _ in columns]
+    if format == "parquet":
+        schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in columns])
+        sink = ExportSink()
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        async for batch in export_batches(table, years):
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+    else:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=names, extrasaction="ignore")
+        writer.writeheader()
+        async for batch in export_batches(table, years):
+            writer.writerows(batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode()
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Streaming response that holds an admission slot until it has been sent"""
+
+    def __init__(self, admission_class: AdmissionClass, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.admission_class = admission_class
+
+    async def __call__(self, scope, receive, send):
+        token = admitted_request.set(True)
+        try:
+            await super().__call__(scope, receive, send)
+        except Exception as e:
+            # Headers are out already, so cutting the stream short is the only way to fail it
+            error = e.exceptions[0] if isinstance(e, ExceptionGroup) else e
+            logger.error(f"Aborted {scope.get('path')}: {getattr(error, 'detail', error)}")
+            raise
+        finally:
+            admitted_request.reset(token)
+            self.admission_class.release()
+
+async def export_response(table: str, years: List[int], format: str) -> StreamingResponse:
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown export table '{table}', expected one of {', '.join(EXPORT_TABLES)}")
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown export format '{format}', expected csv or parquet")
+    if format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed, use format=csv")
+    
+    # Exports are the heaviest requests there are, so they hold a heavy slot while streaming
+    heavy = admission_classes["heavy"]
+    await heavy.acquire()
+    label = str(years[0]) if len(years) == 1 else f"{years[0]}-{years[-1]}"
+    return AdmittedStreamingResponse(
+        heavy,
+        stream_export(table, years, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="f1_{table}_{label}.{format}"'}
+    )
+
+@app.get("/api/export/{year}/{table}")
+async def export_season(year: int, table: str, format: str = "csv"):
+    """Stream a season's results, qualifying, laps or standings as CSV or Parquet"""
+    return await export_response(table, parse_years(str(year)), format)
+
+@app.get("/api/export/{table}")
+async def export_seasons(table: str, years: str, format: str = "csv"):
+    """Stream results, qualifying, laps or standings for a range of seasons (years=2018-2024)"""
+    return await export_response(table, parse_years(years), format)
+
+# Season-level endpoints the batch endpoint can include for each year
+BATCH_SECTIONS = {
+    "calendar": get_season_details,
+    "drivers": get_season_drivers,
+    "constructors": get_season_constructors,
+    "standings": get_driver_standings,
+}
+
+# Seasons resolved at the same time by one batch request
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
+
+async def batch_season_line(year: int, sections: List[str], semaphore: asyncio.Semaphore) -> bytes:
+    """One NDJSON line holding the cached payloads of a season's sections"""
+    async with semaphore:
+        responses = await asyncio.gather(*[BATCH_SECTIONS[section](year) for section in sections], return_exceptions=True)
+    
+    # Cached payloads are already JSON, so they are spliced in as they are
+    parts = [b'{"year":%d' % year]
+    errors = {}
+    for section, response in zip(sections, responses):
+        if isinstance(response, HTTPException):
+            errors[section] = response.detail
+        elif isinstance(response, Exception):
+            logger.error(f"Error getting {section} for {year} in batch: {response}")
+            errors[section] = "Internal error"
+        else:
+            parts.append(b',"%s":%s' % (section.encode(), response.body))
+    if errors:
+        parts.append(b',"errors":' + dumps(errors))
+    parts.append(b"}\n")
+    return b"".join(parts)
+
+async def stream_batch(years: List[int], sections: List[str]):
+    """Resolve every season concurrently and yield each line as soon as its season completes"""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.create_task(batch_season_line(year, sections, semaphore)) for year in years]
+    try:
+        for line in asyncio.as_completed(tasks):
+            yield await line
+    finally:
+        # The client may have gone away mid-stream
+        for task in tasks:
+            task.cancel()
+
+@app.get("/api/batch")
+async def get_batch(years: str, include: str = "calendar"):
+    """Stream calendars, rosters and standings for a range of seasons (years=2005-2024) as NDJSON"""
+    sections = list(dict.fromkeys(section.strip() for section in include.split(",") if section.strip()))
+    unknown = [section for section in sections if section not in BATCH_SECTIONS]
+    if not sections or unknown:
+        raise HTTPException(status_code=400, detail=f"include must list sections from {', '.join(BATCH_SECTIONS)}")
+    return StreamingResponse(stream_batch(parse_years(years), sections), media_type="application/x-ndjson")
+
+def normalize_search_text(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", stripped).split())
+
+def trigrams(text: str) -> set:
+    """Trigrams of each word, padded so word starts weigh more"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class SearchIndex:
+    """In-memory prefix and trigram index over drivers, constructors, circuits and Grands Prix.
+
+    Entities are keyed by type and normalized name, so the same driver or
+    Grand Prix seen in several seasons (and in both eras) is one entry.
+    """
+
+    def __init__(self):
+        self.entities: Dict[str, Dict] = {}
+        self.tokens: List[Tuple[str, str]] = []      # sorted (token, entity key)
+        self.entity_tokens: Dict[str, set] = {}
+        self.trigrams: Dict[str, set] = {}
+        self.seasons: set = set()                    # rosters and calendar all indexed
+        self.built_at: Optional[float] = None
+
+    def add(self, entity_type: str, name: Optional[str], year: int, aliases: Tuple = (), **details):
+        if not name:
+            return
+        normalized = normalize_search_text(name)
+        if not normalized:
+            return
+        key = f"{entity_type}:{normalized}"
+        
+        entity = self.entities.get(key)
+        if entity is None:
+            entity = self.entities[key] = {"type": entity_type, "name": name, "seasons": set(), **details}
+            tokens = set(normalized.split())
+            for alias in aliases:
+                if alias:
+                    tokens.update(normalize_search_text(alias).split())
+            self.entity_tokens[key] = tokens
+            for token in tokens:
+                bisect.insort(self.tokens, (token, key))
+            for trigram in trigrams(normalized):
+                self.trigrams.setdefault(trigram, set()).add(key)
+        else:
+            for field, value in details.items():
+                entity.setdefault(field, value)
+        entity["seasons"].add(year)
+
+    def add_drivers(self, year: int, drivers: List[Dict]):
+        for driver in drivers:
+            given = driver.get("givenName") or driver.get("first_name") or ""
+            family = driver.get("familyName") or driver.get("last_name") or ""
+            name = f"{given} {family}".strip() or driver.get("full_name")
+            code = driver.get("code") or driver.get("name_acronym")
+            self.add("driver", name, year, aliases=(code,), code=code, nationality=driver.get("nationality"))
+
+    def add_constructors(self, year: int, constructors: List[Dict]):
+        for constructor in constructors:
+            nationality = constructor.get("nationality")
+            self.add("constructor", constructor.get("name"), year, nationality=None if nationality == "Unknown" else nationality)
+
+    def add_calendar(self, year: int, races: List[Dict]):
+        for race in races:
+            circuit = race.get("Circuit", {})
+            location = circuit.get("Location", {})
+            locality = location.get("locality") or race.get("location")
+            country = location.get("country") or race.get("country_name")
+            self.add("grand_prix", race.get("raceName") or race.get("meeting_name"), year, aliases=(country,), country=country)
+            self.add("circuit", circuit.get("circuitName") or race.get("circuit_short_name"), year,
+                     aliases=(locality, country), locality=locality, country=country)
+
+    def _prefix_matches(self, token: str) -> set:
+        start = bisect.bisect_left(self.tokens, (token, ""))
+        matches = set()
+        for index in range(start, len(self.tokens)):
+            indexed_token, key = self.tokens[index]
+            if not indexed_token.startswith(token):
+                break
+            matches.add(key)
+        return matches
+
+    def search(self, query: str, entity_type: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        normalized = normalize_search_text(query)
+        if not normalized:
+            return []
+        
+        # Every query word must prefix-match a word of the entity; whole-word
+        # and whole-name matches rank first
+        query_tokens = normalized.split()
+        keys = None
+        for token in query_tokens:
+            matches = self._prefix_matches(token)
+            keys = matches if keys is None else keys & matches
+        scored = [
+            (1.0 + sum(token in self.entity_tokens[key] for token in query_tokens) / len(query_tokens)
+             + (key.split(":", 1)[1] == normalized), key)
+            for key in keys
+        ]
+        
+        # Fall back to trigram similarity for typos and mid-word fragments
+        if not scored:
+            query_trigrams = trigrams(normalized)
+            counts = Counter(key for trigram in query_trigrams for key in self.trigrams.get(trigram, ()))
+            scored = [(count / len(query_trigrams), key) for key, count in counts.items() if count / len(query_trigrams) >= 0.4]
+        
+        results = []
+        for score, key in sorted(scored, key=lambda item: (-item[0], -len(self.entities[item[1]]["seasons"]), item[1])):
+            entity = self.entities[key]
+            if entity_type and entity["type"] != entity_type:
+                continue
+            results.append({**entity, "seasons": sorted(entity["seasons"]), "score": round(score, 2)})
+            if len(results) >= limit:
+                break
+        return results
+
+search_index = SearchIndex()
+search_index_lock = asyncio.Lock()
+
+# Seasons fetched at once while building the search index; its Jolpica
+# requests share the same slots as everyone else's
+SEARCH_INDEX_CONCURRENCY = int(os.environ.get('SEARCH_INDEX_CONCURRENCY', '2'))
+
+# A search waits this long for a running build before answering from what is indexed
+SEARCH_INDEX_WAIT = float(os.environ.get('SEARCH_INDEX_WAIT', '5'))
+
+# Searches retry seasons that failed to index at most this often
+SEARCH_INDEX_RETRY_SECONDS = int(os.environ.get('SEARCH_INDEX_RETRY_SECONDS', '300'))
+
+async def unindexed_seasons() -> List[int]:
+    return [season["year"] for season in (await get_seasons())["seasons"] if season["year"] not in search_index.seasons]
+
+async def build_search_index():
+    """Index the rosters and calendars of every season not indexed yet"""
+    async with search_index_lock:
+        years = await unindexed_seasons()
+        semaphore = asyncio.Semaphore(SEARCH_INDEX_CONCURRENCY)
+        
+        async def index_season(year: int):
+            async with semaphore:
+                try:
+                    drivers, constructors, season = await asyncio.gather(
+                        load_cached_payload(get_season_drivers, year),
+                        load_cached_payload(get_season_constructors, year),
+                        load_cached_payload(get_season_details, year)
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not index season {year}: {e}")
+                    return
+                # Cache hits skip the endpoint bodies, so add the payloads here too
+                search_index.add_drivers(year, drivers["drivers"])
+                search_index.add_constructors(year, constructors["constructors"])
+                search_index.add_calendar(year, season["races"])
+                search_index.seasons.add(year)
+        
+        await asyncio.gather(*[index_season(year) for year in years])
+        search_index.built_at = time.monotonic()
+
+search_index_build: Optional[asyncio.Task] = None
+
+def start_search_index_build() -> asyncio.Task:
+    """Build the search index in the background, once at a time"""
+    global search_index_build
+    if search_index_build is None or search_index_build.done():
+        # A fresh context, so the build isn't bound by the deadline of the request that started it
+        search_index_build = asyncio.create_task(build_search_index(), context=contextvars.Context())
+    return search_index_build
+
+@app.get("/api/search")
+@admission("light")
+async def search(q: str, type: Optional[str] = None, limit: int = 10):
+    """Search drivers, constructors, circuits and Grands Prix across all seasons"""
+    try:
+        if type and type not in ("driver", "constructor", "circuit", "grand_prix"):
+            raise HTTPException(status_code=400, detail=f"Unknown type '{type}'")
+        
+        # Endpoints add what they fetch, but only a build indexes whole seasons
+        built_at = search_index.built_at
+        if (built_at is None or time.monotonic() - built_at > SEARCH_INDEX_RETRY_SECONDS) and await unindexed_seasons():
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(asyncio.shield(start_search_index_build()), SEARCH_INDEX_WAIT)
+        
+        results = search_index.search(q, type, max(1, min(limit, 50)))
+        return {
+            "query": q,
+            "results": results,
+            "total": len(results),
+            "complete": not await unindexed_seasons()
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching for {q}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Startup warm-up
+WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', 'false').lower() == 'true'
+WARMUP_TOP_PAGES = int(os.environ.get('WARMUP_TOP_PAGES', '20'))
+PAGE_STATS_FLUSH_SECONDS = int(os.environ.get('PAGE_STATS_FLUSH_SECONDS', '60'))
+
+warmup_state: Dict[str, Any] = {
+    "status": "pending",
+    "total": 0,
+    "completed": 0,
+    "failed": 0,
+    "started_at": None,
+    "finished_at": None,
+}
+
+# Successful GET hits per API path since the last flush to MongoDB
+page_hits: Counter = Counter()
+
+@app.middleware("http")
+async def count_page_hits(request, call_next):
+    response = await call_next(request)
+    path = request.url.path
+    if request.method == "GET" and response.status_code == 200 and path.startswith("/api/") and not path.startswith(("/api/health", "/api/export", "/api/batch", "/api/profiles")):
+        page_hits[path] += 1
+    return response
+
+async def flush_page_stats():
+    """Add the pending page hit counts to MongoDB"""
+    store = session_store()
+    if not page_hits or store is None:
+        return
+    pending = dict(page_hits)
+    page_hits.clear()
+    try:
+        await store.page_stats.bulk_write([
+            UpdateOne({"path": path}, {"$inc": {"hits": hits}}, upsert=True)
+            for path, hits in pending.items()
+        ], ordered=False)
+    except PyMongoError as e:
+        session_store_failed(e, "Could not flush page stats")
+        page_hits.update(pending)
+
+async def flush_page_stats_periodically():
+    while True:
+        await asyncio.sleep(PAGE_STATS_FLUSH_SECONDS)
+        await flush_page_stats()
+
+def warmable_endpoint(path: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+    """The endpoint serving a path and its path arguments, if a bare GET of it is worth replaying.
+
+    Hit counts are recorded without query strings, so endpoints that need
+    query parameters can't be replayed, and heavy ones would rebuild their
+    widest (default) window.
+    """
+    scope = {"type": "http", "method": "GET", "path": path}
+    for route in app.router.routes:
+        match, child_scope = route.matches(scope)
+        if match != Match.FULL:
+            continue
+        parameters = inspect.signature(route.endpoint).parameters
+        path_params = child_scope.get("path_params", {})
+        if getattr(route.endpoint, "route_class", None) == "heavy" or any(
+            parameter.default is inspect.Parameter.empty and name not in path_params
+            for name, parameter in parameters.items()
+        ):
+            return None
+        return route.endpoint, {
+            name: parameters[name].annotation(value) if name in parameters else value
+            for name, value in path_params.items()
+        }
+    return None
+
+async def warm_path(path: str):
+    """Run the GET endpoint serving a path in-process so its caches fill up"""
+    endpoint = warmable_endpoint(path)
+    if endpoint is not None:
+        await endpoint[0](**endpoint[1])
+
+async def warm_paths(paths: List[str]):
+    for path in paths:
+        try:
+            await warm_path(path)
+            warmup_state["completed"] += 1
+        except Exception as e:
+            logger.warning(f"Warm-up of {path} failed: {e}")
+            warmup_state["failed"] += 1
+
+async def warm_up():
+    """Preload the season index and the most requested pages before reporting ready"""
+    warmup_state.update(status="running", started_at=datetime.now(timezone.utc).isoformat())
+    
+    # The season index first, then the most requested pages
+    season_paths = [f"/api/seasons/{season['year']}" for season in (await get_seasons())["seasons"]]
+    warmup_state["total"] = len(season_paths)
+    await warm_paths(season_paths)
+    await build_search_index()
+    
+    store = session_store()
+    top_paths = []
+    if store is not None:
+        try:
+            cursor = store.page_stats.find({}, {"path": 1}).sort("hits", -1).limit(WARMUP_TOP_PAGES)
+            top_paths = [doc["path"] async for doc in cursor if doc["path"] not in season_paths and warmable_endpoint(doc["path"])]
+        except PyMongoError as e:
+            session_store_failed(e, "Could not load page stats for warm-up")
+    warmup_state["total"] += len(top_paths)
+    await warm_paths(top_paths)
+    
+    warmup_state.update(status="complete", finished_at=datetime.now(timezone.utc).isoformat())
+    logger.info(f"Warm-up complete: {warmup_state['completed']}/{warmup_state['total']} pages")
+
+@app.get("/api/health/live")
+async def liveness():
+    """Report that the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/api/health/admission")
+async def admission_stats():
+    """Report in-flight, queued and shed request counts per route class"""
+    return {name: admission_class.stats() for name, admission_class in admission_classes.items()}
+
+@app.get("/api/health/upstream")
+async def upstream_stats():
+    """Report latency percentiles, hedged requests and timeouts per upstream host"""
+    return {host: latency.stats() for host, latency in upstream_latency.items()}
+
+@app.get("/api/health/ready")
+async def readiness():
+    """Report whether warm-up has finished, with its progress"""
+    ready = warmup_state["status"] in ("complete", "disabled")
+    return ORJSONResponse(
+        {"status": "ready" if ready else "warming_up", "warmup": warmup_state},
+        status_code=200 if ready else 503
+    )
+
+# Token expected in the X-Admin-Token header; admin endpoints are disabled without one
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN))
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject requests that don't carry the configured admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.post("/api/cache/invalidate", dependencies=[Depends(require_admin)])
+async def invalidate_cache(year: int, round: Optional[int] = None, session: Optional[str] = None, include_season: bool = False):
+    """Invalidate the cached responses derived from a season, a round or one of its sessions.
+
+    Without a round the whole season is invalidated. With one, only what was
+    built from that round (or that session of it) is, including the season
+    aggregates that read it; ``include_season`` also invalidates the calendar,
+    rosters and other season-level data.
+    """
+    if session and round is None:
+        raise HTTPException(status_code=400, detail="A session can only be invalidated within a round")
+    
+    tags = [f"season:{year}"] if round is None or include_season else []
+    if round is not None:
+        tags.append(f"session:{year}:{round}:{session.lower()}" if session else f"round:{year}:{round}")
+        if year > 2022:
+            tags.extend(await openf1_round_session_tags(year, round, session))
+    return {"invalidated": invalidate_cache_tags(tags)}
+
+async def openf1_round_session_tags(year: int, round: int, session: Optional[str] = None) -> List[str]:
+    """Tags of the OpenF1 sessions of a round, whose bodies are tagged by session key"""
+    session_name = OPENF1_SESSION_NAMES.get(session.lower()) if session else None
+    if session and session_name is None:
+        return []
+    try:
+        if session_name:
+            _, race_session = await get_openf1_session(year, round, session_name)
+            return [openf1_session_tag(race_session["session_key"])]
+        race_meeting, _ = await get_openf1_session(year, round, "Race")
+        status, body = await fetch_upstream(f"{OPENF1_BASE_URL}/sessions?meeting_key={race_meeting['meeting_key']}", cache=False)
+        return [openf1_session_tag(s["session_key"]) for s in (orjson.loads(body) if status == 200 else [])]
+    except (HTTPException, requests.RequestException) as e:
+        logger.warning(f"Could not resolve OpenF1 sessions of {year}/{round}: {getattr(e, 'detail', e)}")
+        return []
+
+# Per-request sampling profiler: admins opt a request in with an X-Profile: 1
+# header or ?profile=1, and PROFILE_SAMPLE_RATE profiles a share of all requests
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/f1datasite-profiles')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '200'))
+PROFILE_SUFFIXES = {"speedscope": ".speedscope.json", "collapsed": ".collapsed"}
+
+# Profiler of the request the current task works for
+profiled_request: contextvars.ContextVar[Optional["RequestProfiler"]] = contextvars.ContextVar("profiled_request", default=None)
+
+def profiling_task_factory(loop, coro, context=None, **kwargs):
+    """Create tasks as usual, enrolling those spawned by a profiled request in its profile.
+
+    Newer Pythons pass further task options (name, eager_start) to the
+    factory; they are handed to asyncio.Task unchanged.
+    """
+    task = asyncio.Task(coro, loop=loop, context=context, **kwargs)
+    profiler = context.get(profiled_request) if context is not None else profiled_request.get()
+    if profiler is not None:
+        profiler.tasks.append(task)
+    return task
+
+def frame_key(frame) -> Tuple[str, str, int]:
+    code = frame.f_code
+    return code.co_qualname, code.co_filename, code.co_firstlineno
+
+def coroutine_frames(coro) -> List:
+    """Frames of a suspended coroutine and everything it awaits, outermost first"""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+class RequestProfiler:
+    """Wall-clock sampler of the tasks serving one request.
+
+    A background thread wakes every PROFILE_INTERVAL_MS and records one stack
+    per live task: the event loop thread's stack while the task runs, else
+    the chain of coroutines it is suspended in, ending in a "(waiting)" frame.
+    Each task becomes one profile, like a thread in a native profiler.
+    """
+
+    WAITING = ("(waiting)", "", 0)
+
+    def __init__(self, label: str):
+        self.label = label
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.tasks: List[asyncio.Task] = []
+        self.samples: Dict[str, List[Tuple[Tuple[str, str, int], ...]]] = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _sample(self, task: asyncio.Task, running: Optional[asyncio.Task]) -> Tuple[Tuple[str, str, int], ...]:
+        frames = coroutine_frames(task.get_coro())
+        if task is not running:
+            return tuple(frame_key(frame) for frame in frames) + (self.WAITING,)
+        
+        # Trim the event loop machinery above the task's own coroutine
+        stack = []
+        frame = sys._current_frames().get(self.loop_thread)
+        while frame is not None:
+            stack.append(frame)
+            if frames and frame is frames[0]:
+                break
+            frame = frame.f_back
+        return tuple(frame_key(frame) for frame in reversed(stack))
+
+    def _run(self):
+        while not self.stopped.wait(PROFILE_INTERVAL_MS / 1000):
+            running = asyncio.current_task(self.loop)
+            for task in list(self.tasks):
+                if not task.done():
+                    name = task.get_name()
+                    if name.startswith("Task-"):
+                        name += f" {task.get_coro().__qualname__}"
+                    self.samples.setdefault(name, []).append(self._sample(task, running))
+
+    def save(self) -> str:
+        """Write the collapsed stacks and speedscope profile, returning the profile name"""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", self.label).strip("_")[:80]
+        name = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{slug}-{os.urandom(3).hex()}"
+        
+        frames: Dict[Tuple[str, str, int], int] = {}
+        profiles = []
+        collapsed: Counter = Counter()
+        for task_name, stacks in self.samples.items():
+            profiles.append({
+                "type": "sampled",
+                "name": task_name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": len(stacks) * PROFILE_INTERVAL_MS,
+                "samples": [[frames.setdefault(key, len(frames)) for key in stack] for stack in stacks],
+                "weights": [PROFILE_INTERVAL_MS] * len(stacks),
+            })
+            collapsed.update(";".join([task_name] + [key[0] for key in stack]) for stack in stacks)
+        
+        speedscope = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.label} ({self.duration * 1000:.0f} ms)",
+            "exporter": "f1datasite",
+            "shared": {"frames": [{"name": function, "file": file, "line": line} for function, file, line in frames]},
+            "profiles": profiles,
+        }
+        base = os.path.join(PROFILE_DIR, name)
+        with open(base + PROFILE_SUFFIXES["speedscope"], "wb") as f:
+            f.write(orjson.dumps(speedscope))
+        with open(base + PROFILE_SUFFIXES["collapsed"], "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in collapsed.items())
+        
+        for old in recent_profiles()[PROFILE_KEEP:]:
+            for suffix in PROFILE_SUFFIXES.values():
+                with suppress(OSError):
+                    os.remove(os.path.join(PROFILE_DIR, old["name"] + suffix))
+        return name
+
+def recent_profiles() -> List[Dict]:
+    """Saved profiles, newest first"""
+    try:
+        entries = [entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(PROFILE_SUFFIXES["speedscope"])]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda entry: entry.name, reverse=True)
+    return [
+        {
+            "name": entry.name[:-len(PROFILE_SUFFIXES["speedscope"])],
+            "created": datetime.fromtimestamp(entry.stat().st_mtime, timezone.utc).isoformat(),
+            "size": entry.stat().st_size,
+        }
+        for entry in entries
+    ]
+
+@app.middleware("http")
+async def profile_requests(request, call_next):
+    requested = request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"
+    if not (requested and is_admin(request.headers.get("x-admin-token"))) and not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        return await call_next(request)
+    
+    profiler = RequestProfiler(f"{request.method} {request.url.path}")
+    profiler.tasks.append(asyncio.current_task())
+    token = profiled_request.set(profiler)
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiled_request.reset(token)
+        profiler.stop()
+    
+    try:
+        response.headers["X-Profile"] = await asyncio.get_running_loop().run_in_executor(None, profiler.save)
+    except OSError as e:
+        logger.warning(f"Could not save profile of {profiler.label}: {e}")
+    return response
+
+@app.get("/api/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles(limit: int = Query(50, ge=1, le=PROFILE_KEEP)):
+    """List the most recent request profiles"""
+    return {"profiles": recent_profiles()[:limit]}
+
+@app.get("/api/profiles/{name}", dependencies=[Depends(require_admin)])
+async def get_profile(name: str, format: str = "speedscope"):
+    """Download a request profile as speedscope JSON or collapsed stacks"""
+    if format not in PROFILE_SUFFIXES:
+        raise HTTPException(status_code=400, detail="Profile format must be speedscope or collapsed")
+    if name not in {profile["name"] for profile in recent_profiles()}:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(os.path.join(PROFILE_DIR, name + PROFILE_SUFFIXES[format]), filename=name + PROFILE_SUFFIXES[format])
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    if WEB_CONCURRENCY > 1:
+        uvicorn.run("server:app", host="0.0.0.0", port=8001, workers=WEB_CONCURRENCY)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -1,3 +1,4 @@
+import json
 import requests
 import unittest
 import sys
@@ -203,6 +204,35 @@ class F1APITester:
         
         return False
         
+    def test_race_details_selection(self, year, round_num, limit):
+        """Test that sections/include return only the requested data and that lap pages advance"""
+        endpoint = f"/api/races/{year}/{round_num}?sections=race&include=laps&limit={limit}"
+        success, data = self.run_test(f"Race Details Selection ({year}, Round {round_num})", endpoint)
+        
+        if success:
+            race = data.get('race_data') or {}
+            page = race.get('page') or {}
+            if 'qualifying_data' in data or set(race) - {'meeting', 'session', 'laps', 'page'}:
+                print(f"❌ Race details returned unrequested data: {sorted(data)} / {sorted(race)}")
+                return False
+            if not race.get('laps') or any(lap['lap_number'] > limit for lap in race['laps']) or page.get('next_laps_after') != limit:
+                print(f"❌ First lap page is incorrect (next_laps_after: {page.get('next_laps_after')})")
+                return False
+            
+            success, data = self.run_test(f"Race Details Next Page ({year}, Round {round_num})", f"{endpoint}&laps_after={limit}")
+            if success:
+                race = data.get('race_data') or {}
+                page = race.get('page') or {}
+                laps = race.get('laps') or []
+                next_laps_after = page.get('next_laps_after')
+                if laps and all(limit < lap['lap_number'] <= 2 * limit for lap in laps) and (next_laps_after is None or next_laps_after == 2 * limit):
+                    print(f"✅ Lap pages advance: laps 1-{limit}, then {limit + 1}-{2 * limit} (next_laps_after: {next_laps_after})")
+                    return True
+                else:
+                    print(f"❌ Second lap page is incorrect (next_laps_after: {next_laps_after})")
+        
+        return False
+
     def test_qualifying_results(self, year, round_num):
         """Test the qualifying results endpoint for a specific race"""
         success, data = self.run_test(f"Qualifying Results ({year}, Round {round_num})", f"/api/races/{year}/{round_num}/qualifying")
@@ -237,12 +267,17 @@ class F1APITester:
                                 print(f"❌ Qualifying results structure is incorrect for jolpica source")
                         else:
                             print(f"❌ QualifyingResults array is missing or invalid")
-                    elif expected_source == 'openf1':
-                        if 'positions' in data['qualifying_data'] and isinstance(data['qualifying_data']['positions'], list):
-                            print(f"✅ Qualifying positions data is present for openf1 source")
-                            return True
+                    elif expected_source == 'openf1' and data['qualifying_data']:
+                        qualifying = data['qualifying_data'][0]
+                        if 'QualifyingResults' in qualifying and isinstance(qualifying['QualifyingResults'], list) and qualifying['QualifyingResults']:
+                            result = qualifying['QualifyingResults'][0]
+                            if 'position' in result and 'Driver' in result and 'Q1' in result:
+                                print(f"✅ Qualifying segments are classified for openf1 source (pole: {result.get('Q3') or result['Q1']})")
+                                return True
+                            else:
+                                print(f"❌ Qualifying results structure is incorrect for openf1 source")
                         else:
-                            print(f"❌ Qualifying positions data is missing for openf1 source")
+                            print(f"❌ QualifyingResults array is missing or invalid for openf1 source")
                 else:
                     print(f"❌ Qualifying data is missing")
             else:
@@ -297,6 +332,205 @@ class F1APITester:
         
         return False
 
+    def test_lap_pace(self, year, round_num):
+        """Test the lap pace analytics endpoint for a specific race"""
+        success, data = self.run_test(f"Lap Pace ({year}, Round {round_num})", f"/api/races/{year}/{round_num}/pace")
+        
+        if success:
+            if data.get('year') == year and data.get('round') == round_num and 'drivers' in data:
+                print(f"✅ Lap pace for {year} Round {round_num} has {len(data['drivers'])} drivers")
+                
+                if data['drivers']:
+                    driver = data['drivers'][0]
+                    if 'median_pace' in driver and 'best_sectors' in driver and 'stints' in driver:
+                        print(f"✅ Lap pace structure is correct (fastest median: {driver['median_pace']})")
+                        return True
+                    else:
+                        print(f"❌ Lap pace structure is incorrect")
+                else:
+                    print(f"❌ Lap pace has no drivers")
+            else:
+                print(f"❌ Lap pace has incorrect metadata")
+        
+        return False
+
+    def test_race_trace(self, year, round_num):
+        """Test the race trace endpoint for a specific race"""
+        success, data = self.run_test(f"Race Trace ({year}, Round {round_num})", f"/api/races/{year}/{round_num}/trace")
+        
+        if success:
+            expected_source = "jolpica" if year <= 2022 else "openf1"
+            
+            if data.get('year') == year and data.get('data_source') == expected_source and data.get('drivers'):
+                trace = data['drivers'][0]
+                if all(key in trace for key in ('cumulative', 'gap_to_leader', 'gap_to_ahead', 'position')):
+                    print(f"✅ Race trace has {len(data['drivers'])} drivers over {data.get('total_laps')} laps")
+                    return True
+                else:
+                    print(f"❌ Race trace structure is incorrect")
+            else:
+                print(f"❌ Race trace has incorrect metadata or no drivers")
+        
+        return False
+
+    def test_track_map(self, year, round_num):
+        """Test the simplified circuit outline for a specific race"""
+        success, data = self.run_test(f"Track Map ({year}, Round {round_num})", f"/api/races/{year}/{round_num}/track-map")
+        
+        if success:
+            points = data.get('points') or []
+            if data.get('circuit_key') is not None and len(points) >= 3 and all(len(point) == 2 for point in points):
+                print(f"✅ Track map has {len(points)} points simplified from {data.get('raw_points')}")
+                return True
+            else:
+                print(f"❌ Track map structure is incorrect")
+        
+        return False
+
+    def test_telemetry(self, year, round_num, driver_number, lap):
+        """Test the car telemetry endpoint for one lap of a driver"""
+        success, data = self.run_test(
+            f"Telemetry ({year}, Round {round_num}, Car {driver_number}, Lap {lap})",
+            f"/api/races/{year}/{round_num}/telemetry/{driver_number}?lap={lap}"
+        )
+        
+        if success:
+            telemetry = data.get('telemetry') or {}
+            if data.get('driver_number') == driver_number and data.get('lap') == lap and data.get('samples'):
+                if all(len(telemetry.get(key, [])) == len(telemetry['t']) for key in ('speed', 'throttle', 'brake', 'n_gear', 'rpm', 'drs')):
+                    print(f"✅ Telemetry for lap {lap} has {data['samples']} samples from {data['from']} to {data['to']}")
+                    return True
+                else:
+                    print(f"❌ Telemetry channels are missing or misaligned")
+            else:
+                print(f"❌ Telemetry has incorrect metadata or no samples")
+        
+        return False
+
+    def test_head_to_head(self, year):
+        """Test the teammate head-to-head endpoint for a season"""
+        success, data = self.run_test(f"Head-to-Head ({year})", f"/api/seasons/{year}/head-to-head")
+        
+        if success:
+            if data.get('year') == year and isinstance(data.get('teammates'), list) and data['teammates']:
+                pair = data['teammates'][0]
+                if 'qualifying' in pair and 'race' in pair and 'points_delta' in pair:
+                    print(f"✅ Head-to-head for {year} has {len(data['teammates'])} teammate pairs over {len(data.get('rounds', []))} rounds")
+                    return True
+                else:
+                    print(f"❌ Head-to-head pair structure is incorrect")
+            else:
+                print(f"❌ Head-to-head for {year} has incorrect metadata or no pairs")
+        
+        return False
+
+    def test_search(self, query):
+        """Test the search endpoint"""
+        success, data = self.run_test(f"Search ({query})", f"/api/search?q={query}")
+        
+        if success:
+            if data.get('query') == query and isinstance(data.get('results'), list) and data['results']:
+                result = data['results'][0]
+                if 'type' in result and 'name' in result and 'seasons' in result:
+                    print(f"✅ Search for '{query}' returned {data['total']} results, top: {result['name']} ({result['type']})")
+                    return True
+                else:
+                    print(f"❌ Search result structure is incorrect")
+            else:
+                print(f"❌ Search for '{query}' returned no results")
+        
+        return False
+
+    def test_health_ready(self):
+        """Test the readiness endpoint, which answers 503 until warm-up has finished"""
+        url = f"{self.base_url}/api/health/ready"
+        
+        self.tests_run += 1
+        print("\n🔍 Testing Readiness...")
+        
+        try:
+            response = requests.get(url)
+            data = response.json()
+            expected = {200: "ready", 503: "warming_up"}.get(response.status_code)
+            if expected and data.get('status') == expected and 'status' in data.get('warmup', {}):
+                self.tests_passed += 1
+                print(f"✅ Passed - Status: {response.status_code} ({expected}, warm-up {data['warmup']['status']})")
+                return True
+            print(f"❌ Failed - Unexpected readiness response {response.status_code}: {data}")
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+        
+        return False
+
+    def test_health_admission(self):
+        """Test the admission control statistics endpoint"""
+        success, data = self.run_test("Admission Stats", "/api/health/admission")
+        
+        if success:
+            if data and all({'concurrency', 'in_flight', 'queued', 'shed'} <= set(stats) for stats in data.values()):
+                print(f"✅ Admission stats cover route classes {', '.join(sorted(data))}")
+                return True
+            else:
+                print(f"❌ Admission stats structure is incorrect")
+        
+        return False
+
+    def test_export(self, year, table):
+        """Test the CSV export endpoint"""
+        url = f"{self.base_url}/api/export/{year}/{table}"
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing Export ({year} {table})...")
+        
+        try:
+            response = requests.get(url)
+            if response.status_code != 200:
+                print(f"❌ Failed - Expected 200, got {response.status_code}")
+                return False
+            
+            self.tests_passed += 1
+            print(f"✅ Passed - Status: {response.status_code}")
+            lines = response.text.splitlines()
+            if lines and lines[0].startswith("year,round,") and len(lines) > 1:
+                print(f"✅ Export of {year} {table} has {len(lines) - 1} rows")
+                return True
+            else:
+                print(f"❌ Export of {year} {table} is empty or has no header")
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+        
+        return False
+
+    def test_batch(self, years, include):
+        """Test the multi-season NDJSON batch endpoint"""
+        url = f"{self.base_url}/api/batch?years={years}&include={include}"
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing Batch ({years}: {include})...")
+        
+        try:
+            response = requests.get(url)
+            if response.status_code != 200:
+                print(f"❌ Failed - Expected 200, got {response.status_code}")
+                return False
+            
+            self.tests_passed += 1
+            print(f"✅ Passed - Status: {response.status_code}")
+            first, last = (int(year) for year in years.split("-"))
+            lines = [json.loads(line) for line in response.text.splitlines() if line]
+            if sorted(line["year"] for line in lines) == list(range(first, last + 1)):
+                failed = [line["year"] for line in lines if "errors" in line]
+                if not failed:
+                    print(f"✅ Batch returned {include} for all {len(lines)} seasons")
+                    return True
+                print(f"❌ Batch had errors for seasons {failed}")
+            else:
+                print(f"❌ Batch returned {len(lines)} seasons, expected {last - first + 1}")
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+        
+        return False
+
 def main():
     print("=" * 50)
     print("F1 Race Data API Test Suite")
@@ -328,6 +562,9 @@ def main():
     historical_race_ok = tester.test_race_details(historical_year, 1)
     modern_race_ok = tester.test_race_details(modern_year, 1)
     
+    # Test section selection and lap paging (OpenF1 seasons only)
+    modern_selection_ok = tester.test_race_details_selection(modern_year, 1, 5)
+    
     # Test qualifying results (Round 1 for both years)
     historical_qualifying_ok = tester.test_qualifying_results(historical_year, 1)
     modern_qualifying_ok = tester.test_qualifying_results(modern_year, 1)
@@ -336,6 +573,35 @@ def main():
     historical_race_results_ok = tester.test_race_results(historical_year, 1)
     modern_race_results_ok = tester.test_race_results(modern_year, 1)
     
+    # Test lap pace analytics (OpenF1 seasons only)
+    modern_pace_ok = tester.test_lap_pace(modern_year, 1)
+    
+    # Test race traces (Round 1 for both years)
+    historical_trace_ok = tester.test_race_trace(historical_year, 1)
+    modern_trace_ok = tester.test_race_trace(modern_year, 1)
+    
+    # Test track map (OpenF1 seasons only)
+    modern_track_map_ok = tester.test_track_map(modern_year, 1)
+    
+    # Test a lap of car telemetry (OpenF1 seasons only)
+    modern_telemetry_ok = tester.test_telemetry(modern_year, 1, 1, 2)
+    
+    # Test teammate head-to-head
+    historical_h2h_ok = tester.test_head_to_head(historical_year)
+    
+    # Test search (accent-insensitive prefix match)
+    search_ok = tester.test_search("raikk")
+    
+    # Test bulk export
+    historical_export_ok = tester.test_export(historical_year, "results")
+    
+    # Test multi-season batch
+    batch_ok = tester.test_batch("2018-2022", "calendar,standings")
+    
+    # Test health endpoints
+    ready_ok = tester.test_health_ready()
+    admission_ok = tester.test_health_admission()
+    
     # Print summary
     print("\n" + "=" * 50)
     print(f"Tests Run: {tester.tests_run}")
@@ -350,8 +616,18 @@ def main():
         historical_drivers_ok, modern_drivers_ok,
         historical_constructors_ok, modern_constructors_ok,
         historical_race_ok, modern_race_ok,
+        modern_selection_ok,
         historical_qualifying_ok, modern_qualifying_ok,
-        historical_race_results_ok, modern_race_results_ok
+        historical_race_results_ok, modern_race_results_ok,
+        modern_pace_ok,
+        historical_trace_ok, modern_trace_ok,
+        modern_track_map_ok,
+        modern_telemetry_ok,
+        historical_h2h_ok,
+        search_ok,
+        historical_export_ok,
+        batch_ok,
+        ready_ok, admission_ok
     ]
     
     return 0 if all(critical_tests) else 1
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+from backend.server import SharedMemoryCache, SharedMemorySegment
+
+
+class SharedMemorySegmentTest(unittest.TestCase):
+    """Ring wrap-around, bucket eviction and sharing of the memory-mapped cache segment"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(prefix="f1datasite-cache-test-")
+        os.close(fd)
+        os.unlink(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def segment(self, data_size=4096, slot_count=64):
+        size = SharedMemorySegment.HEADER_SIZE + slot_count * SharedMemorySegment.SLOT_SIZE + data_size
+        return SharedMemorySegment(self.path, size, slot_count)
+
+    def test_round_trip(self):
+        segment = self.segment()
+        segment.set("key", b"value", 60)
+        self.assertEqual(segment.get("key"), b"value")
+        self.assertIsNone(segment.get("other"))
+
+    def test_overwritten_key_returns_latest_value(self):
+        segment = self.segment()
+        segment.set("key", b"first", 60)
+        segment.set("key", b"second", 60)
+        self.assertEqual(segment.get("key"), b"second")
+
+    def test_expired_entry_is_a_miss(self):
+        segment = self.segment()
+        segment.set("key", b"value", -1)
+        self.assertIsNone(segment.get("key"))
+
+    def test_ring_wrap_around(self):
+        segment = self.segment(data_size=4096, slot_count=1024)
+        values = {f"key-{i}": os.urandom(200) for i in range(100)}
+        for key, value in values.items():
+            segment.set(key, value, 60)
+
+        # The ring wrapped several times: recent records survive, lapped ones
+        # are misses rather than someone else's bytes
+        self.assertGreater(segment._cursor(), 4 * segment.data_size)
+        hits = {key for key, value in values.items() if segment.get(key) == value}
+        self.assertIn("key-99", hits)
+        self.assertNotIn("key-0", hits)
+        for key in values:
+            self.assertIn(segment.get(key), (None, values[key]))
+
+    def test_bucket_eviction_drops_soonest_to_expire(self):
+        segment = self.segment(slot_count=SharedMemorySegment.SLOTS_PER_BUCKET)
+        segment.set("short", b"short", 10)
+        for i in range(SharedMemorySegment.SLOTS_PER_BUCKET - 1):
+            segment.set(f"long-{i}", b"long", 600)
+        segment.set("new", b"new", 600)
+
+        self.assertIsNone(segment.get("short"))
+        self.assertEqual(segment.get("new"), b"new")
+        for i in range(SharedMemorySegment.SLOTS_PER_BUCKET - 1):
+            self.assertEqual(segment.get(f"long-{i}"), b"long")
+
+    def test_oversized_value_is_not_stored(self):
+        segment = self.segment(data_size=4096)
+        segment.set("big", bytes(2048), 60)
+        self.assertIsNone(segment.get("big"))
+
+    def test_second_mapping_shares_entries(self):
+        writer = self.segment()
+        writer.set("key", b"value", 60)
+
+        # A second worker maps the same file without resetting it
+        reader = self.segment()
+        self.assertEqual(reader.get("key"), b"value")
+        reader.set("other", b"from reader", 60)
+        self.assertEqual(writer.get("other"), b"from reader")
+
+    def test_new_layout_resets_the_table(self):
+        self.segment(slot_count=64).set("key", b"value", 60)
+        self.assertIsNone(self.segment(slot_count=128).get("key"))
+
+    def test_namespaces_are_isolated(self):
+        segment = self.segment()
+        old_build = SharedMemoryCache(segment, "old:response:", 60)
+        new_build = SharedMemoryCache(segment, "new:response:", 60)
+        old_build.set("/api/seasons", b"old payload")
+        self.assertIsNone(new_build.get("/api/seasons"))
+        self.assertEqual(old_build.get("/api/seasons"), b"old payload")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from backend.server import TTLCache
+
+
+class TTLCacheTest(unittest.TestCase):
+    """LRU eviction and byte bound of the in-process cache"""
+
+    def test_hit_moves_entry_to_the_end(self):
+        cache = TTLCache(60, max_entries=2)
+        cache.set("a", b"a")
+        cache.set("b", b"b")
+        cache.get("a")
+        cache.set("c", b"c")
+
+        self.assertEqual(cache.get("a"), b"a")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), b"c")
+
+    def test_bounded_by_bytes(self):
+        cache = TTLCache(60, max_bytes=100)
+        for key in "abcd":
+            cache.set(key, bytes(40))
+
+        self.assertLessEqual(cache.size_bytes, 100)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("d"), bytes(40))
+
+    def test_overwrite_replaces_size(self):
+        cache = TTLCache(60, max_bytes=100)
+        cache.set("a", bytes(80))
+        cache.set("a", bytes(10))
+        cache.set("b", bytes(80))
+
+        self.assertEqual(cache.size_bytes, 90)
+        self.assertEqual(cache.get("a"), bytes(10))
+
+    def test_oversized_value_is_not_stored(self):
+        cache = TTLCache(60, max_bytes=100)
+        cache.set("small", b"small")
+        cache.set("big", bytes(101))
+
+        self.assertIsNone(cache.get("big"))
+        self.assertEqual(cache.get("small"), b"small")
+
+    def test_expired_entry_is_a_miss(self):
+        cache = TTLCache(60)
+        cache.set("key", b"value", -1)
+
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.size_bytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()